@@ -1,11 +1,47 @@
+import gzip
 import json
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from logging import getLogger
+from threading import Lock
+from time import sleep, time
 
-from urllib3 import PoolManager
+from pyfiware.concurrency import AdaptiveLimiter
+from pyfiware.profiling import NO_PHASE, profiled
+from pyfiware.transport import Urllib3Transport
 
 logger = getLogger(__name__)
 
 
+def chunks(iterable, size):
+    """ Group an iterable into lists of size elements."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ngsi_type(value):
+    """ NGSI type name of a Python value"""
+    type_name = type(value).__name__.capitalize()
+    if type_name == "Str":
+        type_name = "String"
+    if type_name == "Int":
+        type_name = "Integer"
+    if type_name == "Dict":
+        type_name = "StructuredValue"
+    return type_name
+
+
+def ngsi_attribute(value):
+    """ NGSI attribute of a Python value"""
+    return {'value': value, "type": ngsi_type(value)}
+
+
 class FiException(Exception):
     """Exception produced by a context broker response"""
     def __init__(self, status, message, *args, **kwargs):
@@ -14,6 +50,14 @@ class FiException(Exception):
         self.message = message
 
 
+class Response:
+    """ Response of the Context Broker with the body already read and decoded"""
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+
 class OrionConnector:
     """ Connects to the Orion context broker and provide easy use for its REST API.
 
@@ -27,7 +71,9 @@ class OrionConnector:
         "Content-Type": "application/json"
     }
 
-    _pool_manager = PoolManager()
+    # Keep enough connections to reuse them in the concurrent methods
+    _transport = Urllib3Transport(maxsize=16)
+    profiler = None
 
     @property
     def service_path(self):
@@ -58,11 +104,23 @@ class OrionConnector:
         else:
             raise Exception("service_path must be list or string")
 
-    def __init__(self, host, codec="utf-8", service=None, service_path=None, oauth_connector=None, authorization_header_name="X-Auth-Token"):
+    def __init__(self, host, codec="utf-8", service=None, service_path=None, oauth_connector=None, authorization_header_name="X-Auth-Token",
+                 compression=False, compression_proxy=None, compression_threshold=64 * 1024, limiter=None,
+                 dedup=None, schemas=None, transport=None, profiler=None):
         """ Initialize the connector.
 
         :param host: The url of the NGSI API  (Ending  '/' will be removed )
         :param codec: The codec used  decoding responses.
+        :param compression: Ask for gzip compressed responses (Orion needs a reverse proxy that compress them).
+        :param compression_proxy: Url of a proxy that accepts gzip compressed request bodies and forwards them to
+            Orion. Bodies larger than compression_threshold bytes are compressed and sent through it.
+        :param compression_threshold: The minimum body size compressed.
+        :param limiter: The AdaptiveLimiter of the concurrent requests of the bulk methods, a default one if not set.
+        :param dedup: Optional WriteDedup, patch, update and batch_update skip the attributes it reports unchanged.
+        :param schemas: Optional SchemaRegistry that create uses to type the attributes.
+        :param transport: The Transport that sends the requests, by default a urllib3 pool shared by all the
+            connectors.
+        :param profiler: Optional Profiler that times the public operations.
         """
         if host[-1] == "/":
             self.host = host[:-1]
@@ -71,9 +129,10 @@ class OrionConnector:
         self.base_url = self.host + "/" + self.version
 
         self.url_entities = self.base_url + "/entities"
-        self.url_types = self.base_url + "/type"
+        self.url_types = self.base_url + "/types"
         self.url_subscriptions = self.base_url + "/subscriptions"
         self.url_batch_update = self.base_url + "/op/update"
+        self.url_batch_query = self.base_url + "/op/query"
         self.batch = self.base_url
 
         self.codec = codec
@@ -85,20 +144,124 @@ class OrionConnector:
         self.oauth = oauth_connector
         self.authorization_header_name = authorization_header_name
 
+        # Compression
+        self.compression = compression
+        self.compression_proxy = compression_proxy.rstrip("/") if compression_proxy else None
+        self.compression_threshold = compression_threshold
+        self.compression_stats = {"received_bytes": 0, "received_decoded": 0, "sent_bytes": 0, "sent_raw": 0}
+        self._stats_lock = Lock()
+
+        # Concurrency of the bulk methods
+        self.limiter = limiter or AdaptiveLimiter()
+
+        # Skip unchanged writes
+        self.dedup = dedup
+
+        # Attribute types of the entity types
+        self.schemas = schemas
+
+        if transport is not None:
+            self._transport = transport
+
+        self.profiler = profiler
+
+    @property
+    def concurrency_limit(self):
+        """ Current amount of concurrent requests of the bulk methods"""
+        return self.limiter.limit
+
+    @property
+    def bytes_saved(self):
+        """ Bytes not transferred thanks to compression"""
+        stats = self.compression_stats
+        return stats["received_decoded"] - stats["received_bytes"] + stats["sent_raw"] - stats["sent_bytes"]
+
+    def _count_bytes(self, direction, transferred, decoded):
+        with self._stats_lock:
+            if direction == "received":
+                self.compression_stats["received_bytes"] += transferred
+                self.compression_stats["received_decoded"] += decoded
+            else:
+                self.compression_stats["sent_bytes"] += transferred
+                self.compression_stats["sent_raw"] += decoded
+
+    def _dedup_key(self, entity_id):
+        return self.service, self.service_path, entity_id
+
+    def scoped(self, service=None, service_path=None):
+        """ Get an immutable view of the connector with its own Fiware-Service and Fiware-ServicePath.
+
+        The view shares the URLs, the connection pool and the OAuth manager of the connector, so it is cheap to
+        create one per request and safe to use it from several threads.
+
+        :param service: The Fiware-Service of the view, None keeps the one of the connector.
+        :param service_path: The Fiware-ServicePath of the view, None keeps the one of the connector.
+
+        :return: A ScopedOrionConnector
+        """
+        return ScopedOrionConnector(self, self.service if service is None else service,
+                                    self.service_path if service_path is None else service_path)
+
+    def _phase(self, name):
+        """ Context manager that times a phase of the current operation when profiling"""
+        return self.profiler.phase(name) if self.profiler else NO_PHASE
+
+    def _decode(self, response):
+        """ Parse the JSON body of a response"""
+        with self._phase("decode"):
+            return json.loads(response.data.decode(self.codec))
+
     def _request(self, body=None, **kwargs):
         """Send a request to the Context Broker"""
         if body:
-            body = json.dumps(body)
+            with self._phase("serialize"):
+                body = json.dumps(body)
         headers = kwargs.pop("headers", {}).copy()
         if self.service:
             headers["Fiware-Service"] = self.service
         if self.service_path and "Fiware-ServicePath" not in headers:
             headers["Fiware-ServicePath"] = self.service_path
         if self.oauth:
-            headers[self.authorization_header_name] = self.oauth.token
+            with self._phase("network"):
+                headers[self.authorization_header_name] = self.oauth.token
         logger.debug("URL %s\nHEADERS %s\nBODY %s\n", kwargs['url'], headers, body)
-        return self._pool_manager.request(body=body, headers=headers, **kwargs)
-
+        if self.compression_proxy and body and len(body) >= self.compression_threshold:
+            with self._phase("serialize"):
+                raw = body.encode(self.codec)
+                body = gzip.compress(raw)
+            self._count_bytes("sent", len(body), len(raw))
+            headers["Content-Encoding"] = "gzip"
+            kwargs["url"] = self.compression_proxy + kwargs["url"][len(self.host):]
+        with self._phase("network"):
+            return self._send(body, headers, **kwargs)
+
+    def _send(self, body, headers, **kwargs):
+        """Send a request through the transport, decompressing the response if compression is set"""
+        if not self.compression:
+            return self._transport.request(body=body, headers=headers, **kwargs)
+
+        headers["Accept-Encoding"] = "gzip"
+        response = self._transport.request(
+            body=body, headers=headers, preload_content=False, decode_content=False, **kwargs)
+        try:
+            if response.headers.get("Content-Encoding", "").lower() == "gzip":
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                parts = []
+                transferred = 0
+                for chunk in response.stream(64 * 1024, decode_content=False):
+                    transferred += len(chunk)
+                    parts.append(decompressor.decompress(chunk))
+                parts.append(decompressor.flush())
+                data = b"".join(parts)
+            else:
+                data = response.read(decode_content=False)
+                transferred = len(data)
+        finally:
+            response.release_conn()
+        self._count_bytes("received", transferred, len(data))
+        return Response(response.status, response.headers, data)
+
+    @profiled
     def get(self, entity_id, entity_type=None, key_values=False):
         """ Get an entity from the context by its ID. If Orion responses not found a None is returned.
 
@@ -124,8 +287,9 @@ class OrionConnector:
                 return None
             raise FiException(response.status, "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
+    @profiled
     def count(self, entity_type=None, id_pattern=None, query=None,
               georel=None, geometry=None, coords=None, hierarchical_search=False):
         """ Get the  total amount of entities that match the provided entity class, id pattern and/or query.
@@ -186,8 +350,10 @@ class OrionConnector:
             raise FiException(response.status, "Error{}: {}".format(response.status, response.data.decode(self.codec)))
         return int(response.headers["fiware-total-count"])
 
+    @profiled
     def search(self, entity_type=None, id_pattern=None, query=None,
-               georel=None, geometry=None, coords=None, limit=0, offset=0, key_values=False, hierarchical_search=False):
+               georel=None, geometry=None, coords=None, limit=0, offset=0, key_values=False, hierarchical_search=False,
+               attrs=None):
         """ Get the list of the entities that match the provided entity class, id pattern and/or query.
 
         :param entity_type: The entity type that the entities must match .
@@ -200,6 +366,7 @@ class OrionConnector:
         :param coords: Semicolon separated list of coordinates(coma separated) Ex: "45.7878,3.455454;41.7878,5.455454"
         :param key_values: Wether a full NGSIv2 entity should be returned or only a keyValues model
         :param hierarchical_search: Search only in this servicePath or in all sub servicePaths as well
+        :param attrs: List of the attributes to retrieve, all of them if not set.
 
         :return: A list of entities or None
         """
@@ -216,6 +383,8 @@ class OrionConnector:
             fields["idPattern"] = id_pattern
         if query:
             fields["q"] = query
+        if attrs:
+            fields["attrs"] = ",".join(attrs)
 
         headers = self.header_no_payload.copy()
         if hierarchical_search:
@@ -251,17 +420,58 @@ class OrionConnector:
                 logger.info("Not found: %s, \nfields: %s", self.url_entities, fields)
                 return []
             raise FiException(response.status, "Error{}: {}".format(response.status, response.data.decode(self.codec)))
-        results = json.loads(response.data.decode(self.codec))
+        results = self._decode(response)
         total_count = int(response.headers["fiware-total-count"])
         count = len(results)
         if not limit:
             limit = total_count
         if total_count - offset >= limit > count:
             results.extend(self.search(entity_type=entity_type, id_pattern=id_pattern, query=query,
-               georel=georel, geometry=geometry, coords=coords, limit=limit-count, offset=offset + count, key_values=key_values, hierarchical_search=hierarchical_search))
+               georel=georel, geometry=geometry, coords=coords, limit=limit-count, offset=offset + count, key_values=key_values, hierarchical_search=hierarchical_search,
+               attrs=attrs))
 
         return results
 
+    def search_pages(self, page_size=1000, offset=0, **search_kwargs):
+        """ Iterate over the pages of a search while the next page is requested in background.
+
+        :param page_size: The amount of entities of each page (at most 1000).
+        :param offset: The offset of the first page.
+        :param search_kwargs: The arguments of search (entity_type, query...).
+
+        :return: A generator of lists of entities
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.search, limit=page_size, offset=offset, **search_kwargs)
+            while future:
+                with self._phase("wait"):
+                    page = future.result()
+                offset += len(page)
+                if len(page) < page_size:
+                    future = None
+                else:
+                    future = executor.submit(self.search, limit=page_size, offset=offset, **search_kwargs)
+                yield page
+
+    @profiled
+    def types(self):
+        """ Get the names of all the entity types.
+
+        :return: A list of type names
+        """
+        names = []
+        while True:
+            fields = {"options": "values,count", "limit": 1000, "offset": len(names)}
+            response = self._request(method="GET", url=self.url_types, headers=self.header_no_payload, fields=fields)
+            if response.status // 200 != 1:
+                raise FiException(response.status,
+                                  "Error{}: {}".format(response.status, response.data.decode(self.codec)))
+            page = self._decode(response)
+            names.extend(page)
+            if not page or len(names) >= int(response.headers["fiware-total-count"]):
+                return names
+
+    @profiled
     def delete(self, entity_id, silent=False, entity_type=None):
         """Delete a entity  from the Context broker.
 
@@ -275,6 +485,8 @@ class OrionConnector:
         if entity_type:
             get_url += "?type=" + entity_type
 
+        if self.dedup:
+            self.dedup.forget(self._dedup_key(entity_id))
         response = self._request(
                 method="DELETE", url=get_url, headers=self.header_no_payload)
         if response.status // 200 != 1:
@@ -283,22 +495,19 @@ class OrionConnector:
                 raise FiException(response.status,
                                   "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
-    def create(self, element_id, element_type, **attributes):
-        body = {'id': element_id, "type": element_type}
-
-        for key in attributes:
-            type_name = type(attributes[key]).__name__.capitalize()
-            if type_name == "Str":
-                type_name = "String"
-            if type_name == "Int":
-                type_name = "Integer"
-            if type_name == "Dict":
-                type_name = "StructuredValue"
-            body[key] = {'value': attributes[key], "type": type_name}
+    @profiled
+    def create(self, element_id, element_type, *, upsert=False, **attributes):
+        if self.schemas is not None:
+            body = self.schemas.serialize(element_id, element_type, attributes)
+        else:
+            body = {'id': element_id, "type": element_type}
+            for key in attributes:
+                body[key] = ngsi_attribute(attributes[key])
 
-        self.create_raw(element_id, element_type, **body)
+        self.create_raw(element_id, element_type, upsert=upsert, **body)
 
-    def create_raw(self, element_id, element_type, **attributes):
+    @profiled
+    def create_raw(self, element_id, element_type, *, upsert=False, **attributes):
         """ Create a Entity in the context broker. The entities can be passed as parameters or as a dictionary with **
         or attributes.
 
@@ -307,9 +516,11 @@ class OrionConnector:
             fiware_manager.create(element_id="1", element_type="fake", **{'weight': 300, 'size': "100l"})
             fiware_manager.create(element_id="1", element_type="fake", attributes= {'weight': 300, 'size': "100l"})
             fiware_manager.create(element_id="1", element_type="fake", weight=300, size="100l")
+            fiware_manager.create(element_id="1", element_type="fake", upsert=True, weight=350)
 
         :param element_id: The ID of the entity
         :param element_type: The Type on the entity
+        :param upsert: Update the attributes if the entity already exists instead of failing (one request).
         :param attributes:  The attributes for the entity.
 
         :return: Nothing
@@ -319,15 +530,25 @@ class OrionConnector:
         if element_type:
             attributes["type"] = element_type
 
+        url = self.url_entities + "?options=upsert" if upsert else self.url_entities
         response = self._request(
-            method="POST", url=self.url_entities, body=attributes, headers=self.header_payload)
+            method="POST", url=url, body=attributes, headers=self.header_payload)
         if response.status // 200 != 1:
             raise FiException(response.status, "Error{}: {}".format(response.status, response.data.decode(self.codec)))
+        if self.dedup:
+            self.dedup.remember(self._dedup_key(attributes["id"]), attributes.get("type"),
+                                self._attributes(attributes))
 
+    @profiled
     def patch(self, element_id, element_type, **attributes):
 
         url = self.url_entities + "/" + element_id + "/attrs?type=" + element_type
 
+        if self.dedup:
+            attributes = self.dedup.changed(self._dedup_key(element_id), element_type, attributes)
+            if not attributes:
+                self.dedup.skipped()
+                return
         response = self._request(
                 method="PATCH", url=url, body=attributes, headers=self.header_payload)
         if response.status // 200 != 1:
@@ -335,10 +556,18 @@ class OrionConnector:
                 logger.debug("Not found: %s", url)
             raise FiException(response.status,
                                 "Error{}: {}".format(response.status, response.data.decode(self.codec)))
+        if self.dedup:
+            self.dedup.remember(self._dedup_key(element_id), element_type, attributes)
 
+    @profiled
     def update(self, element_id, element_type, **attributes):
         url = self.url_entities + "/" + element_id + "/attrs?type=" + element_type
 
+        if self.dedup:
+            attributes = self.dedup.changed(self._dedup_key(element_id), element_type, attributes)
+            if not attributes:
+                self.dedup.skipped()
+                return
         response = self._request(
                 method="POST", url=url, body=attributes, headers=self.header_payload)
         if response.status // 200 != 1:
@@ -346,10 +575,16 @@ class OrionConnector:
                 logger.debug("Not found: %s", url)
             raise FiException(response.status,
                                 "Error{}: {}".format(response.status, response.data.decode(self.codec)))
+        if self.dedup:
+            self.dedup.remember(self._dedup_key(element_id), element_type, attributes)
 
+    @profiled
     def delete_attribute(self, element_id, element_type, attribute_name):
         url = self.url_entities + "/" + element_id + "/attrs/" + attribute_name + "?type=" + element_type
 
+        if self.dedup:
+            self.dedup.forget(self._dedup_key(element_id), element_type, attribute_name)
+
         response = self._request(
                 method="DELETE", url=url)
         if response.status // 200 != 1:
@@ -358,6 +593,7 @@ class OrionConnector:
             raise FiException(response.status,
                                 "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+    @profiled
     def batch_update(self, action_type, entities):
         """ Create/Modify/Delete multiple entities at once in the context broker.
 
@@ -371,6 +607,15 @@ class OrionConnector:
         :return: Nothing
         """
 
+        if self.dedup:
+            entities = self._dedup_entities(action_type, entities)
+            if not entities:
+                self.dedup.skipped()
+                return
+        self._send_batch_update(action_type, entities)
+
+    def _send_batch_update(self, action_type, entities):
+        """ Send a batch update without the dedup filter, then record the written attributes in the dedup"""
         body = {
                 "actionType": action_type,
                 "entities": entities
@@ -381,6 +626,354 @@ class OrionConnector:
         if response.status // 200 != 1:
             raise FiException(response.status, "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+        if not self.dedup:
+            return
+        for entity in entities:
+            key, attributes = self._dedup_key(entity["id"]), self._attributes(entity)
+            if action_type != "delete":
+                self.dedup.remember(key, entity.get("type"), attributes)
+            elif not attributes:
+                self.dedup.forget(key)
+            else:
+                for name in attributes:
+                    self.dedup.forget(key, entity.get("type"), name)
+
+    @staticmethod
+    def _attributes(entity):
+        return {name: value for name, value in entity.items() if name not in ("id", "type")}
+
+    def _dedup_entities(self, action_type, entities):
+        """ Remove the unchanged attributes of the entities of a batch update"""
+        if action_type not in ("append", "appendStrict", "update"):
+            # Replaced or deleted entities lose their previous attributes
+            for entity in entities:
+                self.dedup.forget(self._dedup_key(entity["id"]))
+            return entities
+
+        changed_entities = []
+        for entity in entities:
+            attributes = self._attributes(entity)
+            changed = self.dedup.changed(self._dedup_key(entity["id"]), entity.get("type"), attributes)
+            if changed or not attributes:
+                changed_entity = {name: entity[name] for name in ("id", "type") if name in entity}
+                changed_entity.update(changed)
+                changed_entities.append(changed_entity)
+        return changed_entities
+
+    @profiled
+    def batch_query(self, entities, attrs=None, limit=1000):
+        """ Get several entities at once from the context broker. Entities that do not exist are not returned.
+
+        :param entities: A list of dicts with the id (and type) of the entities.
+        :param attrs: Optional list of the attributes returned.
+        :param limit: The maximum amount of entities returned (Orion allows up to 1000).
+
+        :return: A list of entities
+        """
+        body = {"entities": [{name: entity[name] for name in ("id", "type") if entity.get(name)}
+                             for entity in entities]}
+        if attrs:
+            body["attrs"] = list(attrs)
+        response = self._request(
+            method="POST", url=self.url_batch_query + "?limit=" + str(limit), body=body, headers=self.header_payload)
+        if response.status // 200 != 1:
+            raise FiException(response.status, "Error{}: {}".format(response.status, response.data.decode(self.codec)))
+        return self._decode(response)
+
+    @staticmethod
+    def _same_attribute(current, desired):
+        if not isinstance(desired, dict):
+            return current.get("value") == desired
+        return (current.get("value") == desired.get("value") and
+                desired.get("type", current.get("type")) == current.get("type") and
+                (desired.get("metadata") or {}) == (current.get("metadata") or {}))
+
+    def _sync_chunk(self, entities, remove):
+        stats = {"entities": len(entities), "created": 0, "updated": 0, "unchanged": 0,
+                 "attributes_set": 0, "attributes_removed": 0}
+        current = {(entity["id"], entity["type"]): entity
+                   for entity in self.batch_query(entities, limit=len(entities))}
+        changes = []
+        removals = []
+        for entity in entities:
+            existing = current.get((entity["id"], entity.get("type", "Thing")))
+            attributes = self._attributes(entity)
+            keys = {name: entity[name] for name in ("id", "type") if name in entity}
+            if existing is None:
+                stats["created"] += 1
+                stats["attributes_set"] += len(attributes)
+                changes.append(entity)
+                continue
+            changed = {name: value for name, value in attributes.items()
+                       if name not in existing or not self._same_attribute(existing[name], value)}
+            removed = [name for name in self._attributes(existing) if name not in attributes] if remove else []
+            if not changed and not removed:
+                stats["unchanged"] += 1
+                continue
+            stats["updated"] += 1
+            if changed:
+                stats["attributes_set"] += len(changed)
+                changes.append(dict(keys, **changed))
+            if removed:
+                stats["attributes_removed"] += len(removed)
+                removals.append(dict(keys, **{name: {} for name in removed}))
+        # The differences come from the broker state, so they are written even if the dedup remembers them
+        if changes:
+            self._send_batch_update("append", changes)
+        if removals:
+            self._send_batch_update("delete", removals)
+        return stats
+
+    @profiled
+    def sync_entity(self, entity, remove=True):
+        """ Converge an entity to the desired state sending only the differences.
+
+        :param entity: The desired entity, with its attributes as in batch_update.
+        :param remove: Delete the attributes of the entity that are not in the desired state.
+
+        :return: A dict with the counts of the changes, as sync_entities
+        """
+        return self._sync_chunk([entity], remove)
+
+    @profiled
+    def sync_entities(self, entities, remove=True, chunk_size=100, max_workers=None, progress=None):
+        """ Converge any amount of entities to their desired state sending only the differences.
+
+        The entities are processed in chunks. The current state of each chunk is requested at once with
+        batch_query, then the new and changed attributes are written with a batch_update("append") and the
+        attributes not desired with a batch_update("delete"). Unchanged entities send nothing.
+
+        :param entities: An iterable of desired entities, consumed lazily.
+        :param remove: Delete the attributes of the entities that are not in the desired state.
+        :param chunk_size: The amount of entities of each request (up to 1000).
+        :param max_workers: Fixed number of concurrent chunks, by default the connector limiter sets it.
+        :param progress: Optional function called with the amount of entities processed.
+
+        :return: A dict with the amount of entities, created, updated and unchanged entities, and set and removed
+            attributes.
+        """
+        totals = {"entities": 0, "created": 0, "updated": 0, "unchanged": 0, "attributes_set": 0,
+                  "attributes_removed": 0}
+        chunk_stats = self._map_concurrent(lambda chunk: self._sync_chunk(chunk, remove),
+                                           chunks(entities, chunk_size), max_workers)
+        for stats in chunk_stats:
+            for name, value in stats.items():
+                totals[name] += value
+            if progress:
+                progress(totals["entities"])
+        return totals
+
+    def _map_concurrent(self, function, iterable, max_workers=None, retries=0, retry_delay=0.5):
+        """ Apply a function to the items of an iterable concurrently.
+
+        The iterable is consumed lazily and the results are yielded as they are completed. The concurrent calls
+        follow the limit of the connector limiter, that is informed of the latency and overload errors of each
+        call (keyed by the function, so each bulk method has its own baseline latency), unless a fixed max_workers
+        is set. The concurrency is capped to the connections kept by the transport.
+
+        :param max_workers: Fixed number of concurrent calls, None to use the limiter.
+        :param retries: Retries of each call that fails with an overload error (429 or 5xx).
+        :param retry_delay: Seconds to wait before the first retry, doubled on each retry.
+        """
+        limiter = self.limiter if max_workers is None else None
+        key = getattr(function, "__qualname__", None)
+        connections = self._transport.maxsize or float("inf")
+        workers = min(limiter.maximum if limiter else max_workers, connections)
+
+        def call(item):
+            for attempt in range(retries + 1):
+                start = time()
+                try:
+                    result = function(item)
+                except FiException as ex:
+                    overload = ex.status == 429 or (ex.status or 0) // 100 == 5
+                    if limiter and overload:
+                        limiter.failure(time() - start)
+                    if attempt == retries or not overload:
+                        raise
+                    logger.debug("Retrying after error %s", ex.status)
+                    sleep(retry_delay * 2 ** attempt)
+                else:
+                    if limiter:
+                        limiter.success(time() - start, key)
+                    return result
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = set()
+            for item in iterable:
+                while len(futures) >= min(limiter.limit if limiter else max_workers, workers):
+                    with self._phase("wait"):
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                futures.add(executor.submit(call, item))
+            while futures:
+                with self._phase("wait"):
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    @profiled
+    def batch_update_many(self, action_type, entities, chunk_size=100, max_workers=None, progress=None, retries=0):
+        """ Apply a batch_update to any amount of entities, split in chunks that are sent concurrently.
+
+        The entities are consumed lazily so a generator can be used with constant memory.
+
+        :param action_type: Can be one of "append", "appendStrict", "update", "delete" or "replace"
+        :param entities: An iterable of entities
+        :param chunk_size: The amount of entities of each request.
+        :param max_workers: Fixed number of concurrent requests, by default the connector limiter sets it.
+        :param progress: Optional function called with the amount of entities processed after each chunk.
+        :param retries: Retries of the chunks rejected by overload (429 or 5xx).
+
+        :return: The amount of entities processed
+        """
+        def send(chunk):
+            self.batch_update(action_type, chunk)
+            return len(chunk)
+
+        total = 0
+        for count in self._map_concurrent(send, chunks(entities, chunk_size), max_workers, retries):
+            total += count
+            if progress:
+                progress(total)
+        return total
+
+    @profiled
+    def upsert_many(self, entities, chunk_size=100, max_workers=None, progress=None, retries=0):
+        """ Create the entities or update their attributes if they already exist, one request per chunk.
+
+        It is a batch_update_many("append"), so the existing attributes not included are kept.
+
+        :param entities: An iterable of entities, consumed lazily.
+        :param chunk_size: The amount of entities of each request.
+        :param max_workers: Fixed number of concurrent requests, by default the connector limiter sets it.
+        :param progress: Optional function called with the amount of entities processed after each chunk.
+        :param retries: Retries of the chunks rejected by overload (429 or 5xx).
+
+        :return: The amount of entities processed
+        """
+        return self.batch_update_many("append", entities, chunk_size=chunk_size, max_workers=max_workers,
+                                      progress=progress, retries=retries)
+
+    def _write_scope(self, operation):
+        """ The connector that searches the entities a bulk write can reach.
+
+        Orion writes in a single service path (/ if it is not set) while a search without service path covers all
+        of them, so the search is pinned to the service path of the writes.
+        """
+        if not self._service_path:
+            return self.scoped(service_path="/")
+        if "," in self._service_path or "#" in self._service_path:
+            raise FiException(None, "{0} needs a single service path, not {1}".format(operation, self._service_path))
+        return self
+
+    @profiled
+    def delete_where(self, entity_type=None, id_pattern=None, query=None, chunk_size=100, max_workers=None,
+                     progress=None):
+        """ Delete all the entities that match the provided entity class, id pattern and/or query.
+
+        The ids of the matching entities are requested in pages without attributes and each page is deleted with
+        concurrent chunked batch_update("delete") calls. Orion deletes in a single service path, so only the
+        entities of the service path of the connector (/ if it is not set) are deleted; use a scoped view for each
+        sub path of a tree.
+
+        :param entity_type: The entity type that the entities must match .
+        :param id_pattern: The entity id pattern that the entities must match.
+        :param query: The query that the entities must match.
+        :param chunk_size: The amount of entities of each delete request.
+        :param max_workers: Fixed number of concurrent requests, by default the connector limiter sets it.
+        :param progress: Optional function called with the amount of entities deleted.
+
+        :return: The amount of deleted entities
+        """
+        scope = self._write_scope("delete_where")
+        deleted = 0
+        previous = None
+        while True:
+            # Deleted entities disappear from the results, so the first page is requested each time.
+            # "id" is not an attribute, so only the id and type of the entities are returned.
+            page = scope.search(entity_type=entity_type, id_pattern=id_pattern, query=query, limit=1000,
+                                key_values=True, attrs=["id"])
+            if not page:
+                return deleted
+            keys = [{"id": entity["id"], "type": entity["type"]} for entity in page]
+            if keys == previous:
+                raise FiException(None, "Unable to delete the entities, {0} deleted".format(deleted))
+            previous = keys
+
+            def page_progress(count):
+                if progress:
+                    progress(deleted + count)
+
+            deleted += self.batch_update_many("delete", keys, chunk_size=chunk_size, max_workers=max_workers,
+                                              progress=page_progress)
+
+    @profiled
+    def update_where(self, filters, attributes, action="update", dry_run=False, chunk_size=100, max_workers=None,
+                     progress=None):
+        """ Set the same attributes in all the entities that match the filters.
+
+        The ids of the matching entities are streamed in pages without attributes and the change is applied with
+        concurrent chunked batch_update calls. As the pages are requested by offset, the filters must not depend on
+        the updated attributes.
+
+        Examples:
+
+            fiware_manager.update_where({"entity_type": "Sensor", "query": "zone==north"},
+                                        {"status": {"value": "maintenance", "type": "Text"}}, action="append")
+
+        :param filters: Arguments of search that select the entities (entity_type, id_pattern, query...) in the
+            service path of the connector (/ if it is not set), hierarchical_search is not supported.
+        :param attributes: The attributes to set, as in patch.
+        :param action: The batch_update action type: "update", "append" or "replace"
+        :param dry_run: Only count the entities that would be changed.
+        :param chunk_size: The amount of entities of each request.
+        :param max_workers: Fixed number of concurrent requests, by default the connector limiter sets it.
+        :param progress: Optional function called with the amount of entities processed.
+
+        :return: The amount of changed entities (or matching entities in dry run)
+        """
+        if filters.get("hierarchical_search"):
+            raise FiException(None, "update_where writes in a single service path, hierarchical_search is not "
+                                    "supported")
+        scope = self._write_scope("update_where")
+        if dry_run:
+            return scope.count(**filters)
+
+        entities = ({"id": entity["id"], "type": entity["type"], **attributes}
+                    for page in scope.search_pages(key_values=True, attrs=["id"], **filters)
+                    for entity in page)
+        return self.batch_update_many(action, entities, chunk_size=chunk_size, max_workers=max_workers,
+                                      progress=progress)
+
+    @profiled
+    def multi_tenant(self, services, operation="search", max_workers=None, **kwargs):
+        """ Run the same query concurrently in several tenants (Fiware-Service).
+
+        The connector is not modified, each tenant is queried from a scoped view, so it is safe to call it from
+        several threads.
+
+        Examples:
+
+            fiware_manager.multi_tenant(["city1", "city2"], "count", entity_type="Room")
+
+        :param services: The tenants to query.
+        :param operation: One of "search", "count" or "get".
+        :param max_workers: Fixed number of concurrent requests, by default the connector limiter sets it.
+        :param kwargs: The arguments of the operation.
+
+        :return: A dict with the result of each tenant
+        """
+        if operation not in ("search", "count", "get"):
+            raise FiException(None, "({0}) is not a valid multi tenant operation.".format(operation))
+
+        def run(service):
+            return service, getattr(self.scoped(service=service), operation)(**kwargs)
+
+        return dict(self._map_concurrent(run, services, max_workers))
+
+    @profiled
     def unsubscribe(self, url=None, subscription_id=None):
         if (url is None) == (subscription_id is None):
             raise FiException(None, "Set URL or subscription_id")
@@ -397,6 +990,7 @@ class OrionConnector:
             raise FiException(response.status,
                               "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+    @profiled
     def subscribe(self, description,
                   entities, condition_attributes=None, condition_expression=None,
                   notification_attrs=None, notification_attrs_blacklist=None,
@@ -457,6 +1051,7 @@ class OrionConnector:
 
         return response.headers["location"].split('/')[-1], response.headers["location"]
 
+    @profiled
     def subscription(self, subscription_id=None):
         fields = {}
         url = self.url_subscriptions
@@ -468,9 +1063,10 @@ class OrionConnector:
         if response.status // 200 != 1:
             raise FiException(response.status,
                               "Error{}: {}".format(response.status, response.data.decode(self.codec)))
-        data = json.loads(response.data.decode(self.codec))
+        data = self._decode(response)
         return data
 
+    @profiled
     def subscriptions(self, limit=None, offset=None, count=False):
         fields = {}
         url = self.url_subscriptions
@@ -486,12 +1082,13 @@ class OrionConnector:
         if response.status // 200 != 1:
             raise FiException(response.status,
                               "Error{}: {}".format(response.status, response.data.decode(self.codec)))
-        data = json.loads(response.data.decode(self.codec))
+        data = self._decode(response)
         if type(data) == list and len(data) == 1:
             data = data[0]
 
         return data
 
+    @profiled
     def subscription_update(self,
                             subscription_id, status=None, description=None,
                             entities=None, condition_attributes=None, condition_expression=None,
@@ -560,3 +1157,23 @@ class OrionConnector:
         if response.status // 200 != 1:
             raise FiException(response.status,
                               "Error{}: {}".format(response.status, response.data.decode(self.codec)))
+
+
+class ScopedOrionConnector(OrionConnector):
+    """ Immutable view of an OrionConnector with its own Fiware-Service and Fiware-ServicePath.
+
+    Use OrionConnector.scoped to create it.
+    """
+
+    def __init__(self, connector, service, service_path):  # pylint: disable=super-init-not-called
+        attributes = dict(connector.__dict__)
+        attributes.pop("_frozen", None)
+        attributes["service"] = service
+        self.__dict__.update(attributes)
+        self.service_path = service_path
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("_frozen"):
+            raise AttributeError("Scoped connectors are immutable, use scoped() to get another one")
+        super().__setattr__(name, value)
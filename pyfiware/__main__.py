@@ -0,0 +1,3 @@
+from pyfiware.cli import main
+
+main()
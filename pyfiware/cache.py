@@ -0,0 +1,131 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from threading import Lock
+from time import time
+
+logger = getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def timestamp(value):
+    """ Convert a datetime, an ISO 8601 string or POSIX seconds into integer microseconds. Naive dates are UTC."""
+    if isinstance(value, (int, float)):
+        return round(value * 1000000)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_timestamp(value):
+    """ Convert integer microseconds into a UTC datetime."""
+    return EPOCH + value * MICROSECOND
+
+
+class HistoryCache:
+    """ Persistent SQLite cache of history records.
+
+    For each series (scenario, type, id, attributes and query) the cache records which time intervals are already
+    downloaded, so only the missing sub-ranges are requested. Intervals closer to now than revalidate seconds are
+    never marked as covered, so they are requested again each time. The least recently used series are evicted when
+    the stored data exceeds max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, revalidate=600):
+        """ Initialize the cache.
+
+        :param path: Path of the SQLite database.
+        :param max_bytes: Maximum size of the stored records.
+        :param revalidate: Seconds before now that are always requested again.
+        """
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS series (key TEXT PRIMARY KEY, last_used REAL, size INTEGER);
+            CREATE TABLE IF NOT EXISTS ranges (key TEXT, since INTEGER, until INTEGER);
+            CREATE TABLE IF NOT EXISTS records (key TEXT, time INTEGER, data TEXT);
+            CREATE INDEX IF NOT EXISTS records_key_time ON records (key, time);
+            CREATE INDEX IF NOT EXISTS ranges_key ON ranges (key);
+        """)
+
+    @staticmethod
+    def key(scenario_id, entity_type, entity_id, attributes=None, query=None):
+        """ Key of a series of records"""
+        return json.dumps([scenario_id, entity_type, entity_id,
+                           sorted(attributes) if attributes is not None else None, query], sort_keys=True)
+
+    def missing(self, key, since, until):
+        """ Get the sub-ranges of [since, until) that are not covered by the cache.
+
+        :return: A list of (since, until) pairs of datetimes
+        """
+        start, end = timestamp(since), timestamp(until)
+        with self._lock:
+            covered = self._db.execute(
+                "SELECT since, until FROM ranges WHERE key = ? AND until > ? AND since < ? ORDER BY since",
+                (key, start, end)).fetchall()
+        missing = []
+        cursor = start
+        for range_since, range_until in covered:
+            if range_since > cursor:
+                missing.append((cursor, range_since))
+            cursor = max(cursor, range_until)
+        if cursor < end:
+            missing.append((cursor, end))
+        return [(from_timestamp(a), from_timestamp(b)) for a, b in missing]
+
+    def store(self, key, since, until, records, time_key="time"):
+        """ Replace the records of [since, until) and mark the range as covered, except its recent part."""
+        start, end = timestamp(since), timestamp(until)
+        rows = [(key, timestamp(record[time_key]), json.dumps(record)) for record in records]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM records WHERE key = ? AND time >= ? AND time < ?", (key, start, end))
+            self._db.executemany("INSERT INTO records VALUES (?, ?, ?)", rows)
+
+            end = min(end, timestamp(time() - self.revalidate))
+            if start < end:
+                ranges = self._db.execute(
+                    "SELECT since, until FROM ranges WHERE key = ? AND until >= ? AND since <= ?",
+                    (key, start, end)).fetchall()
+                for range_since, range_until in ranges:
+                    start, end = min(start, range_since), max(end, range_until)
+                self._db.execute("DELETE FROM ranges WHERE key = ? AND until >= ? AND since <= ?",
+                                 (key, start, end))
+                self._db.execute("INSERT INTO ranges VALUES (?, ?, ?)", (key, start, end))
+
+            size = self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM records WHERE key = ?",
+                                    (key,)).fetchone()[0]
+            self._db.execute("INSERT OR REPLACE INTO series VALUES (?, ?, ?)", (key, time(), size))
+            self._evict(key)
+
+    def get(self, key, since, until):
+        """ Get the cached records of [since, until) sorted by time."""
+        with self._lock, self._db:
+            self._db.execute("UPDATE series SET last_used = ? WHERE key = ?", (time(), key))
+            rows = self._db.execute(
+                "SELECT data FROM records WHERE key = ? AND time >= ? AND time < ? ORDER BY time",
+                (key, timestamp(since), timestamp(until))).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def _evict(self, current_key):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM series").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._db.execute("SELECT key, size FROM series WHERE key != ? ORDER BY last_used LIMIT 1",
+                                   (current_key,)).fetchone()
+            if row is None:
+                break
+            key, size = row
+            logger.debug("Evicting %s from history cache", key)
+            for table in ("series", "ranges", "records"):
+                self._db.execute("DELETE FROM {0} WHERE key = ?".format(table), (key,))
+            total -= size
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,311 @@
+""" Command line tools of pyfiware.
+
+    pyfiware dump http://127.0.0.1:1026 backup/ --service tenant --service-path /
+    pyfiware dump http://127.0.0.1:1026 backup/ --service tenant --service-path /,/a,/a/b
+    pyfiware restore http://127.0.0.1:1026 backup/ --service other_tenant
+    pyfiware load http://127.0.0.1:1026 sensors.csv --entity-type Sensor
+    pyfiware loadgen http://127.0.0.1:1026 --entities 10000 --rate 500 --duration 60
+"""
+import gzip
+import json
+import os
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from logging import getLogger
+from threading import Lock
+from time import time
+from urllib.parse import quote, unquote
+
+from pyfiware import OrionConnector
+from pyfiware.concurrency import AdaptiveLimiter
+from pyfiware.loader import load as load_rows, read_rows
+from pyfiware.loadgen import LoadGenerator, format_report, parse_mix
+from pyfiware.testing import FakeOrion
+from pyfiware.transport import Urllib3Transport
+
+logger = getLogger(__name__)
+
+
+class Throughput:
+    """ Thread safe counter that prints the processed entities per second."""
+
+    def __init__(self, label="entities", stream=sys.stderr):
+        self.label = label
+        self.stream = stream
+        self.count = 0
+        self.start = time()
+        self._lock = Lock()
+
+    @property
+    def rate(self):
+        elapsed = time() - self.start
+        return self.count / elapsed if elapsed else 0
+
+    def add(self, count):
+        with self._lock:
+            self.count += count
+            self.stream.write("\r{0} {1} ({2:.0f}/s)".format(self.count, self.label, self.rate))
+            self.stream.flush()
+
+    def close(self):
+        self.stream.write("\r{0} {1} in {2:.1f}s ({3:.0f}/s)\n".format(
+            self.count, self.label, time() - self.start, self.rate))
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(path + ".tmp", path)
+
+
+def connector(args, service_path=None):
+    return OrionConnector(args.host, service=args.service, service_path=service_path or args.service_path,
+                          limiter=AdaptiveLimiter(maximum=args.workers),
+                          transport=Urllib3Transport(maxsize=args.workers))
+
+
+def service_paths(text):
+    """ The exact service paths of a dump, the comma separated --service-path.
+
+    Orion does not return the service path of the entities, so a hierarchical service path (/#) cannot be dumped
+    and restored as a tree, the sub paths must be listed.
+    """
+    paths = [path.strip() for path in text.split(",") if path.strip()]
+    for path in paths:
+        if "#" in path:
+            raise ArgumentTypeError("hierarchical service path {0}, list each service path of the tree "
+                                    "instead".format(path))
+    if not paths:
+        raise ArgumentTypeError("no service path")
+    return paths
+
+
+def path_directory(directory, service_path):
+    """ The directory of the dump of a service path"""
+    return os.path.join(directory, quote(service_path, safe=""))
+
+
+def dump(args):
+    """ Dump every entity type of a tenant to gzipped NDJSON parts, one type per worker.
+
+    Only the entities of / are dumped without --service-path, instead of Orion's default of every service path.
+    With several service paths each one is dumped to its own sub directory.
+    """
+    paths = args.service_path or ["/"]
+    orion = connector(args, service_path=paths[0])
+    meter = Throughput()
+    if len(paths) > 1:
+        for path in paths:
+            dump_directory(args, orion.scoped(service_path=path), path_directory(args.directory, path), meter)
+    else:
+        dump_directory(args, orion, args.directory, meter)
+    meter.close()
+
+
+def dump_directory(args, orion, directory, meter):
+    """ Dump the entities of a connector into a directory.
+
+    Each part is written to a temporary file and renamed when complete, then the checkpoint records the offset
+    reached, so an interrupted dump continues from the last complete part.
+    """
+    os.makedirs(directory, exist_ok=True)
+    checkpoint_path = os.path.join(directory, "dump.checkpoint.json")
+    checkpoint = load_checkpoint(checkpoint_path)
+    lock = Lock()
+
+    def dump_type(entity_type):
+        state = checkpoint.get(entity_type, {"offset": 0, "done": False})
+        if state["done"]:
+            return
+        offset = state["offset"]
+        prefix = os.path.join(directory, quote(entity_type, safe=""))
+        part = []
+        for page in orion.search_pages(args.page_size, offset=offset, entity_type=entity_type):
+            part.extend(page)
+            meter.add(len(page))
+            if len(part) >= args.part_size:
+                offset = write_part(entity_type, prefix, offset, part)
+                part = []
+        write_part(entity_type, prefix, offset, part, done=True)
+
+    def write_part(entity_type, prefix, offset, part, done=False):
+        if part:
+            path = "{0}.{1:012d}.ndjson.gz".format(prefix, offset)
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as part_file:
+                for entity in part:
+                    part_file.write(json.dumps(entity) + "\n")
+            os.replace(path + ".tmp", path)
+        with lock:
+            checkpoint[entity_type] = {"offset": offset + len(part), "done": done}
+            save_checkpoint(checkpoint_path, checkpoint)
+        return offset + len(part)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for _ in executor.map(dump_type, orion.types()):
+            pass
+
+
+def read_part(path):
+    with gzip.open(path, "rt", encoding="utf-8") as part_file:
+        for line in part_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def restore(args):
+    """ Restore the parts of a dump with concurrent chunked batch_update(append).
+
+    The sub directories of a dump of several service paths are restored each one under its own service path.
+    """
+    orion = connector(args)
+    meter = Throughput()
+    restore_directory(args, orion, args.directory, meter)
+    for directory in sorted(glob(path_directory(args.directory, "/") + "*")):
+        if os.path.isdir(directory):
+            restore_directory(args, orion.scoped(service_path=unquote(os.path.basename(directory))), directory, meter)
+    meter.close()
+
+
+def restore_directory(args, orion, directory, meter):
+    """ Restore the parts of a directory with a connector.
+
+    Completed parts are recorded in a checkpoint, so an interrupted restore continues with the pending parts.
+    """
+    checkpoint_path = os.path.join(directory, "restore.checkpoint.json")
+    checkpoint = load_checkpoint(checkpoint_path)
+    done = set(checkpoint.get("done", []))
+
+    for path in sorted(glob(os.path.join(directory, "*.ndjson.gz"))):
+        name = os.path.basename(path)
+        if name in done:
+            continue
+        restored = 0
+
+        def progress(count):
+            nonlocal restored
+            meter.add(count - restored)
+            restored = count
+
+        orion.batch_update_many("append", read_part(path), chunk_size=args.chunk_size, progress=progress, retries=3)
+        done.add(name)
+        save_checkpoint(checkpoint_path, {"done": sorted(done)})
+
+
+def load(args):
+    """ Load CSV or NDJSON files with adaptive concurrency."""
+    orion = connector(args)
+    meter = Throughput("rows")
+    for path in args.files:
+        loaded = 0
+
+        def progress(count):
+            nonlocal loaded
+            meter.add(count - loaded)
+            loaded = count
+
+        rows = read_rows(path, args.format, (args.id_column, args.type_column))
+        load_rows(orion, rows, entity_type=args.entity_type, id_column=args.id_column,
+                  type_column=args.type_column, action_type=args.action, chunk_size=args.chunk_size,
+                  progress=progress)
+    meter.close()
+
+
+def loadgen(args):
+    """ Run a synthetic device load and print the report."""
+    if args.host == "fake":
+        orion = FakeOrion().connector(service=args.service, service_path=args.service_path)
+    else:
+        orion = OrionConnector(args.host, service=args.service, service_path=args.service_path,
+                               transport=Urllib3Transport(maxsize=args.workers))
+    generator = LoadGenerator(orion, entities=args.entities, tenants=args.tenants, entity_type=args.entity_type,
+                              mix=parse_mix(args.mix), rate=args.rate, batch_size=args.batch_size,
+                              max_workers=args.workers, seed=args.seed)
+    if not args.no_setup:
+        generator.setup()
+    report = generator.run(args.duration)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+def positive_float(text):
+    value = float(text)
+    if not value > 0:
+        raise ArgumentTypeError("must be positive: {0}".format(text))
+    return value
+
+
+def parser():
+    main_parser = ArgumentParser(prog="pyfiware", description="Tools for the Fiware Orion context broker")
+    commands = main_parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, function, help_text, workers=4, workers_help="Concurrent requests",
+                    host_help="URL of the context broker", service_path_help="Fiware-ServicePath",
+                    service_path_type=None):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("host", help=host_help)
+        command.add_argument("--service", default=None, help="Fiware-Service (tenant)")
+        command.add_argument("--service-path", default=None, type=service_path_type, help=service_path_help)
+        command.add_argument("--workers", type=int, default=workers, help=workers_help)
+        command.set_defaults(function=function)
+        return command
+
+    command = add_command("dump", dump, "Dump all the entities into gzipped NDJSON files",
+                          service_path_help="Fiware-ServicePath (default /), or a comma separated list of them "
+                                            "dumped each one to its own sub directory (hierarchical /# paths are "
+                                            "not supported)",
+                          service_path_type=service_paths)
+    command.add_argument("directory", help="Destination directory")
+    command.add_argument("--page-size", type=int, default=1000, help="Entities of each request")
+    command.add_argument("--part-size", type=int, default=100000, help="Entities of each file")
+
+    command = add_command("restore", restore, "Restore the entities of a dump", workers=32,
+                          workers_help="Maximum concurrent requests, adapted to the broker response",
+                          service_path_help="Fiware-ServicePath of the entities, the sub directories of a dump of "
+                                            "several service paths are restored under their own one")
+    command.add_argument("directory", help="Directory of the dump")
+    command.add_argument("--chunk-size", type=int, default=100, help="Entities of each request")
+
+    command = add_command("load", load, "Load entities from CSV or NDJSON files", workers=32,
+                          workers_help="Maximum concurrent requests, adapted to the broker response")
+    command.add_argument("files", nargs="+", help="CSV (with header) or NDJSON files")
+    command.add_argument("--format", choices=["csv", "ndjson"], default=None, help="Default: from extension")
+    command.add_argument("--entity-type", default=None, help="Type of the rows without type column")
+    command.add_argument("--id-column", default="id", help="Column of the entity id")
+    command.add_argument("--type-column", default="type", help="Column of the entity type")
+    command.add_argument("--action", default="append", help="batch_update action type")
+    command.add_argument("--chunk-size", type=int, default=100, help="Entities of each request")
+
+    command = add_command("loadgen", loadgen, "Simulate devices and report throughput and latencies", workers=16,
+                          workers_help="Maximum operations in flight (and pooled connections)",
+                          host_help="URL of the context broker, or fake to use an in process FakeOrion")
+    command.add_argument("--entities", type=int, default=1000, help="Devices of each tenant")
+    command.add_argument("--tenants", type=int, default=1, help="Tenants, loadgen0, loadgen1... if more than one")
+    command.add_argument("--entity-type", default="Device", help="Type of the devices")
+    command.add_argument("--mix", default="patch=80,batch_update=5,get=10,search=5",
+                         help="Weights of the operations: patch, batch_update, get and search")
+    command.add_argument("--rate", type=positive_float, default=100, help="Operations per second")
+    command.add_argument("--duration", type=float, default=10, help="Seconds of load")
+    command.add_argument("--batch-size", type=int, default=50, help="Entities of each batch_update and search")
+    command.add_argument("--seed", type=int, default=None, help="Seed for repeatable runs")
+    command.add_argument("--no-setup", action="store_true", help="Do not create the devices first")
+    command.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    return main_parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from logging import getLogger
+from threading import Lock
+from time import time
+
+logger = getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """ AIMD concurrency limit for bulk operations.
+
+    The limit grows by one after a full limit of successful requests and is multiplied by backoff when a request
+    fails with an overload error (429 or 5xx) or when its latency exceeds latency_tolerance times the baseline
+    latency. At most one decrease is applied per latency interval, so a burst of slow responses counts once.
+
+    The baseline is kept per kind of call (key), as a whole sync chunk is much slower than a count, and it is the
+    lowest latency seen decayed towards the latencies observed, so a few fast calls do not make every later request
+    look overloaded.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, backoff=0.5, latency_tolerance=2.0, baseline_decay=0.05):
+        """ Initialize the limiter.
+
+        :param initial: The initial limit.
+        :param minimum: The lowest limit.
+        :param maximum: The highest limit.
+        :param backoff: Factor applied to the limit on overload.
+        :param latency_tolerance: Latency, relative to the baseline, considered overload.
+        :param baseline_decay: Fraction of the distance to each slower latency that the baseline moves.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.baseline_decay = baseline_decay
+        self._limit = float(initial)
+        self._baselines = {}
+        self._last_decrease = 0
+        self._lock = Lock()
+
+    @property
+    def limit(self):
+        """ Current amount of concurrent requests allowed"""
+        return int(self._limit)
+
+    def baseline(self, key=None):
+        """ Baseline latency of a kind of call, None until one is recorded"""
+        return self._baselines.get(key)
+
+    def success(self, latency, key=None):
+        """ Record a successful request and its latency in seconds.
+
+        :param key: The kind of call, each one has its own baseline latency.
+        """
+        with self._lock:
+            baseline = self._baselines.get(key)
+            if baseline is not None and latency > baseline * self.latency_tolerance:
+                self._decrease(latency)
+            else:
+                self._limit = min(self._limit + 1 / self._limit, self.maximum)
+            if baseline is None or latency < baseline:
+                self._baselines[key] = latency
+            else:
+                self._baselines[key] = baseline + (latency - baseline) * self.baseline_decay
+
+    def failure(self, latency=0):
+        """ Record a request rejected by overload"""
+        with self._lock:
+            self._decrease(latency)
+
+    def _decrease(self, latency):
+        now = time()
+        if now - self._last_decrease >= latency:
+            self._last_decrease = now
+            self._limit = max(self._limit * self.backoff, self.minimum)
+            logger.debug("Concurrency limit decreased to %s", self.limit)
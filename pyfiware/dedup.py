@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+
+logger = getLogger(__name__)
+
+
+class WriteDedup:
+    """ Bounded memory of the last attribute values written to the context broker.
+
+    It is used by OrionConnector to drop the attributes that would be written with the same value (or with a
+    numeric difference within the tolerance of the attribute). When more than max_entities entities are stored
+    the least recently written are forgotten.
+    """
+
+    def __init__(self, max_entities=100000, tolerances=None):
+        """ Initialize the store.
+
+        :param max_entities: Maximum amount of entities remembered.
+        :param tolerances: Dict of attribute name to the numeric difference considered unchanged.
+        """
+        self.max_entities = max_entities
+        self.tolerances = tolerances or {}
+        self.dropped_attributes = 0
+        self.skipped_requests = 0
+        self._entities = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _comparable(attribute):
+        if isinstance(attribute, dict):
+            return attribute.get("value"), attribute.get("type"), attribute.get("metadata") or None
+        return attribute, None, None
+
+    def _unchanged(self, name, last, new):
+        if last == new:
+            return True
+        tolerance = self.tolerances.get(name)
+        if tolerance is None or last[1:] != new[1:]:
+            return False
+        last_value, new_value = last[0], new[0]
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                   for value in (last_value, new_value)):
+            return False
+        return abs(new_value - last_value) <= tolerance
+
+    def changed(self, entity_key, entity_type, attributes):
+        """ Get the attributes whose value differs from the last one written.
+
+        :param entity_key: Tuple that identifies the entity id (with its service and service path).
+        :param entity_type: The type of the entity.
+        :param attributes: The attributes to write.
+
+        :return: A dict with the changed attributes
+        """
+        changed = {}
+        with self._lock:
+            values = self._entities.get(entity_key, {})
+            for name, attribute in attributes.items():
+                last = values.get((entity_type, name))
+                if last is not None and self._unchanged(name, last, self._comparable(attribute)):
+                    self.dropped_attributes += 1
+                else:
+                    changed[name] = attribute
+        return changed
+
+    def remember(self, entity_key, entity_type, attributes):
+        """ Store the attributes written to an entity."""
+        with self._lock:
+            values = self._entities.setdefault(entity_key, {})
+            for name, attribute in attributes.items():
+                values[(entity_type, name)] = self._comparable(attribute)
+            self._entities.move_to_end(entity_key)
+            while len(self._entities) > self.max_entities:
+                self._entities.popitem(last=False)
+
+    def skipped(self):
+        """ Count a request that was not sent because nothing changed."""
+        with self._lock:
+            self.skipped_requests += 1
+
+    def forget(self, entity_key, entity_type=None, name=None):
+        """ Forget an attribute of an entity, or all the entities with the id if name is not set."""
+        with self._lock:
+            if name is None:
+                self._entities.pop(entity_key, None)
+            else:
+                self._entities.get(entity_key, {}).pop((entity_type, name), None)
@@ -0,0 +1,299 @@
+""" Streaming export of Orion entities and history records to Parquet. Requires pyarrow.
+
+The pages are converted into Arrow record batches as they arrive and written as Parquet row groups, so the memory
+used is bounded by the row group size whatever the size of the export.
+
+Example:
+
+    export_search(OrionConnector("http://127.0.0.1:1026"), "rooms.parquet", entity_type="Room")
+"""
+import json
+import os
+from datetime import datetime
+from logging import getLogger
+
+from pyfiware import chunks
+
+logger = getLogger(__name__)
+
+NGSI_TYPES = {
+    "Number": "float",
+    "Float": "float",
+    "Integer": "int",
+    "Boolean": "bool",
+    "Text": "string",
+    "String": "string",
+    "DateTime": "timestamp",
+}
+
+PYTHON_TYPES = {
+    float: "float",
+    int: "int",
+    bool: "bool",
+    str: "string",
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("export requires pyarrow: pip install pyfiware[export]")
+    return pyarrow
+
+
+def _arrow_type(pa, kind):
+    return {
+        "null": pa.null(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+        "bool": pa.bool_(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "json": pa.string(),
+    }[kind]
+
+
+def _value(item):
+    """ Value of an attribute, both in normalized and keyValues forms"""
+    if isinstance(item, dict) and "value" in item:
+        return item["value"]
+    return item
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _fits(kind, value):
+    """ Whether a value can be stored in a column kind without loss"""
+    if value is None or kind == "json":
+        return True
+    if kind == "float":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if kind == "int":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "bool":
+        return isinstance(value, bool)
+    if kind == "string":
+        return isinstance(value, str)
+    if kind == "timestamp":
+        try:
+            _parse_timestamp(value)
+            return True
+        except (AttributeError, TypeError, ValueError):
+            return False
+    return False
+
+
+def _kind(item):
+    """ Column kind of an attribute, from its NGSI type if its value fits it or from the Python type of its value"""
+    value = _value(item)
+    if value is None:
+        return "null"
+    if isinstance(item, dict) and "type" in item and "value" in item:
+        kind = NGSI_TYPES.get(item["type"], "json")
+        if _fits(kind, value):
+            return kind
+    return PYTHON_TYPES.get(type(value), "json")
+
+
+def merge_kinds(kind, other):
+    """ Column kind able to store the values of two kinds: int is widened to float, other conflicts to json"""
+    if kind is None or kind == "null" or kind == other:
+        return other
+    if other == "null":
+        return kind
+    if {kind, other} == {"int", "float"}:
+        return "float"
+    return "json"
+
+
+def infer_columns(records, columns=None):
+    """ Infer the column kinds of a list of entities or records.
+
+    :param columns: Columns already inferred (from previous pages) that are widened to fit the records.
+
+    :return: A dict of column name to kind ("null", "float", "int", "bool", "string", "timestamp" or "json")
+    """
+    columns = dict(columns or {})
+    for record in records:
+        for name, item in record.items():
+            if name in ("id", "type") and isinstance(item, str):
+                columns[name] = merge_kinds(columns.get(name), "string")
+            else:
+                columns[name] = merge_kinds(columns.get(name), _kind(item))
+    return columns
+
+
+def _convert(kind, value):
+    if value is None:
+        return None
+    if kind == "json":
+        return json.dumps(value)
+    if not _fits(kind, value):
+        raise ValueError("Value {0!r} does not fit a {1} column".format(value, kind))
+    if kind == "float":
+        return float(value)
+    return value
+
+
+def _timestamp_array(pa, values):
+    try:
+        return pa.array(values, pa.string()).cast(pa.timestamp("us", tz="UTC"))
+    except pa.ArrowInvalid:
+        return pa.array([None if value is None else _parse_timestamp(value) for value in values],
+                        pa.timestamp("us", tz="UTC"))
+
+
+def _array(pa, kind, values):
+    if kind == "timestamp":
+        return _timestamp_array(pa, values)
+    return pa.array(values, _arrow_type(pa, kind))
+
+
+def to_record_batch(records, columns):
+    """ Convert a list of entities or records into an Arrow record batch with the given columns."""
+    pa = _pyarrow()
+    present = set()
+    for record in records:
+        present.update(record)
+    # Sparse attributes are missing in most batches, their columns are built without visiting the records
+    arrays = [_array(pa, kind, [_convert(kind, _value(record.get(name))) for record in records])
+              if name in present else pa.nulls(len(records), _arrow_type(pa, kind))
+              for name, kind in columns.items()]
+    return pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+
+def _schema(pa, columns):
+    return pa.schema([(name, _arrow_type(pa, kind)) for name, kind in columns.items()])
+
+
+def _widen_table(pa, table, old_columns, columns):
+    """ Convert a table written with old_columns into the schema of columns"""
+    arrays = []
+    for name, kind in columns.items():
+        old_kind = old_columns.get(name)
+        if old_kind is None:
+            arrays.append(pa.nulls(table.num_rows, _arrow_type(pa, kind)))
+        elif old_kind == kind:
+            arrays.append(table.column(name))
+        elif kind != "json":
+            # From null, or int to float
+            arrays.append(table.column(name).cast(_arrow_type(pa, kind)))
+        else:
+            values = table.column(name).to_pylist()
+            if old_kind == "timestamp":
+                values = [None if value is None else value.isoformat() for value in values]
+            if old_kind != "json":
+                values = [None if value is None else json.dumps(value) for value in values]
+            arrays.append(pa.array(values, pa.string()))
+    return pa.Table.from_arrays(arrays, schema=_schema(pa, columns))
+
+
+def _merge(pa, path, parts, columns, compression):
+    """ Write the row groups of the part files into a Parquet file with the final columns, one row group at a
+    time, and remove the parts"""
+    writer = pa.parquet.ParquetWriter(path, _schema(pa, columns), compression=compression)
+    try:
+        for part_path, part_columns in parts:
+            source = pa.parquet.ParquetFile(part_path)
+            for index in range(source.num_row_groups):
+                table = source.read_row_group(index)
+                writer.write_table(_widen_table(pa, table, part_columns, columns), row_group_size=table.num_rows)
+            source.close()
+    finally:
+        writer.close()
+
+
+def write_parquet(pages, path, row_group_size=50000, compression="snappy"):
+    """ Write an iterable of pages (lists of entities or records) into a Parquet file.
+
+    The columns are inferred from the pages as they arrive. When a page brings a new attribute or a value that does
+    not fit its column (a float in an int column is widened to float, other conflicts to a json column), the next
+    row groups are written to a new part file with the new columns. At the end the parts are merged into the
+    file in a single pass with the final columns, so no value is lost and each row is rewritten once at most.
+
+    :return: The amount of rows written
+    """
+    pa = _pyarrow()
+    writer = None
+    columns = {}
+    written_columns = None
+    # List of (part path, columns of the part)
+    parts = []
+    buffered = []
+    rows = 0
+    try:
+        for page in pages:
+            if not page:
+                continue
+            columns = infer_columns(page, columns)
+            buffered.extend(page)
+            if len(buffered) >= row_group_size:
+                writer, written_columns = _write(pa, writer, path, parts, buffered, written_columns, columns,
+                                                 compression)
+                rows += len(buffered)
+                buffered = []
+        if buffered:
+            writer, written_columns = _write(pa, writer, path, parts, buffered, written_columns, columns,
+                                             compression)
+            rows += len(buffered)
+        if writer:
+            writer.close()
+            writer = None
+        if len(parts) == 1:
+            os.replace(parts[0][0], path)
+        elif parts:
+            _merge(pa, path, parts, columns, compression)
+    finally:
+        if writer:
+            writer.close()
+        for part_path, _ in parts:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    logger.info("Exported %s rows to %s", rows, path)
+    return rows
+
+
+def _write(pa, writer, path, parts, records, written_columns, columns, compression):
+    """ Write a row group, in a new part file if the columns changed"""
+    if writer is None or written_columns != columns:
+        if writer:
+            writer.close()
+        parts.append(("{0}.part{1}".format(path, len(parts)), dict(columns)))
+        writer = pa.parquet.ParquetWriter(parts[-1][0], _schema(pa, columns), compression=compression)
+    writer.write_table(pa.Table.from_batches([to_record_batch(records, columns)]), row_group_size=len(records))
+    return writer, dict(columns)
+
+
+def export_search(connector, path, page_size=1000, row_group_size=50000, **search_kwargs):
+    """ Export the entities that match an OrionConnector.search into a Parquet file.
+
+    :param connector: The OrionConnector.
+    :param path: The destination file.
+    :param page_size: The amount of entities of each request (at most 1000).
+    :param search_kwargs: Arguments of the search (entity_type, query...).
+
+    :return: The amount of exported entities
+    """
+    return write_parquet(connector.search_pages(page_size, **search_kwargs), path, row_group_size)
+
+
+def export_history(history, path, scenario_id, entity_type, entity_id=None, since=None, until=None,
+                   attributes=None, query=None, page_size=1000, row_group_size=50000):
+    """ Export the history of an entity, or of all the entities of a type, into a Parquet file.
+
+    :param history: The HistoryConnector.
+    :param path: The destination file.
+
+    :return: The amount of exported records
+    """
+    if entity_id is None:
+        records = history.entities_get_iter(scenario_id, entity_type, since=since, until=until,
+                                            page_size=page_size, attributes=attributes, query=query)
+    else:
+        records = history.entity_get_iter(scenario_id, entity_type, entity_id, since=since, until=until,
+                                          page_size=page_size, attributes=attributes, query=query)
+    return write_parquet(chunks(records, page_size), path, row_group_size)
@@ -1,11 +1,30 @@
+import asyncio
 import json
-from datetime import datetime, timezone
+import re
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from logging import getLogger
+from threading import Lock
+from time import sleep, time
+from weakref import WeakKeyDictionary
 
-from urllib3 import PoolManager
+from pyfiware.profiling import NO_PHASE, profiled
+from pyfiware.transport import Urllib3Transport
 
 logger = getLogger(__name__)
 
+FREQUENCY_UNITS = {"us": 1, "ms": 1000, "s": 1000000, "min": 60000000, "h": 3600000000, "d": 86400000000}
+
+
+def parse_frequency(freq):
+    """ Convert a frequency like "15min", "1h" or "30s" into microseconds."""
+    match = re.fullmatch(r"\s*(\d*)\s*(us|ms|s|min|h|d)\s*", freq)
+    if not match:
+        raise ValueError("Invalid frequency: {0}".format(freq))
+    return int(match.group(1) or 1) * FREQUENCY_UNITS[match.group(2)]
+
 
 class HistoryException(Exception):
     def __init__(self, status, message, *args, **kwargs):
@@ -16,66 +35,102 @@ class HistoryException(Exception):
 
 class HistoryConnector:
 
-    _pool_manager = PoolManager()
+    # Keep enough connections to reuse them in the concurrent methods
+    _transport = Urllib3Transport(maxsize=16)
+    profiler = None
 
-    def __init__(self, host, token, codec="utf-8", version="api"):
+    def __init__(self, host, token, codec="utf-8", version="api", cache=None, transport=None, profiler=None):
+        """ Initialize the connector.
+
+        :param cache: Optional HistoryCache used by fetch_range to avoid requesting the same ranges again.
+        :param transport: The Transport that sends the requests, by default a urllib3 pool shared by all the
+            connectors.
+        :param profiler: Optional Profiler that times the public operations.
+        """
         self.host = host + "/" + version
         self.codec = codec
         self.token = token
+        self.cache = cache
+        if transport is not None:
+            self._transport = transport
+        self.profiler = profiler
         self.header_payload = {
             "Accept": "application/json",
             "Content-Type": "application/json",
             "Access-Token": self.token,
         }
 
+    def _phase(self, name):
+        """ Context manager that times a phase of the current operation when profiling"""
+        return self.profiler.phase(name) if self.profiler else NO_PHASE
+
+    def _encode(self, data):
+        with self._phase("serialize"):
+            return json.dumps(data)
+
+    def _decode(self, response):
+        with self._phase("decode"):
+            return json.loads(response.data.decode(self.codec))
+
+    def _request(self, method, url, **kwargs):
+        """Send a request to the history server"""
+        with self._phase("network"):
+            return self._transport.request(method=method, url=url, **kwargs)
+
+    @profiled
     def scenario_create(self, scenario_id):
-        response = self._pool_manager.request(method="POST", url="{0}/scenario/{1}".format(
+        response = self._request(method="POST", url="{0}/scenario/{1}".format(
             self.host, scenario_id))
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+    @profiled
     def scenario_socket_connect(self, scenario_id):
-        response = self._pool_manager.request(method="POST", url="{0}/scenario/{1}/socket".format(
+        response = self._request(method="POST", url="{0}/scenario/{1}/socket".format(
             self.host, scenario_id))
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+    @profiled
     def scenario_delete(self, scenario_id):
-        response = self._pool_manager.request(method="DELETE", url="{0}/scenario/{1}".format(
+        response = self._request(method="DELETE", url="{0}/scenario/{1}".format(
             self.host, scenario_id))
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+    @profiled
     def scenario_socket_close(self, scenario_id):
-        response = self._pool_manager.request(method="DELETE", url="{0}/scenario/{1}/socket".format(
+        response = self._request(method="DELETE", url="{0}/scenario/{1}/socket".format(
             self.host, scenario_id))
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
+    @profiled
     def scenario_list(self, user_id=None):
         fields = {}
         if user_id:
             fields["user_id"] = user_id
 
-        response = self._pool_manager.request(method="GET", url="{0}/scenarios".format(self.host), fields=fields)
+        response = self._request(method="GET", url="{0}/scenarios".format(self.host), fields=fields)
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
+    @profiled
     def scenario_get(self, scenario_id):
         url = "{0}/scenario/{1}".format(self.host, scenario_id)
-        response = self._pool_manager.request(method="GET", url=url)
+        response = self._request(method="GET", url=url)
 
         if response.status // 200 != 1:
             if response.status == 404:
@@ -85,8 +140,9 @@ class HistoryConnector:
                 response.status, "Error{}: {}".format(response.status,
                                                       response.data.decode(self.codec)))
 
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
+    @profiled
     def entity_list(self, scenario_id, since=None, until=None, limit=9999, offset=0):
         fields = {
             "limit": limit,
@@ -100,7 +156,7 @@ class HistoryConnector:
             fields['time<'] = '{0}'.format(until.replace(tzinfo=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')) \
                 if until.__class__ is datetime else until
 
-        response = self._pool_manager.request(
+        response = self._request(
             method="GET", url="{0}/scenario/{1}/entities".format(self.host, scenario_id), headers=self.header_payload,
             fields=fields
         )
@@ -109,8 +165,9 @@ class HistoryConnector:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
+    @profiled
     def entity_get(self, scenario_id, entity_type, entity_id, since=None, until=None, limit=9999, offset=0, attributes=None, query=None):
         fields = {
             "attributes": "*",
@@ -131,7 +188,7 @@ class HistoryConnector:
             fields['time<'] = '{0}'.format(until.replace(tzinfo=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')) \
                 if until.__class__ is datetime else until
 
-        response = self._pool_manager.request(
+        response = self._request(
             method="GET", url="{0}/scenario/{1}/entity/{2}/{3}".format(self.host, scenario_id, entity_type, entity_id),
             headers=self.header_payload, fields=fields
         )
@@ -140,9 +197,10 @@ class HistoryConnector:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
 
+    @profiled
     def entities_get(self, scenario_id, entity_type, since=None, until=None, limit=9999, offset=0, attributes=None, query=None):
         fields = {
             "attributes": "*",
@@ -164,7 +222,7 @@ class HistoryConnector:
             fields['time<'] = '{0}'.format(until.replace(tzinfo=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')) \
                 if until.__class__ is datetime else until
 
-        response = self._pool_manager.request(
+        response = self._request(
             method="GET", url="{0}/scenario/{1}/entities/{2}".format(self.host, scenario_id, entity_type),
             headers=self.header_payload, fields=fields
         )
@@ -173,9 +231,10 @@ class HistoryConnector:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
 
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
 
+    @profiled
     def entity_list_by_type(self, scenario_id, entity_type, since=None, until=None, limit=9999, offset=0, attrs=None):
         fields = {
             "attributes": "*",
@@ -190,36 +249,237 @@ class HistoryConnector:
             fields['time<'] = '{0}'.format(until.replace(tzinfo=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')) \
                 if until.__class__ is datetime else until
 
-        response = self._pool_manager.request(
+        response = self._request(
             method="GET", url="{0}/scenario/{1}/entities/{2}".format(self.host, scenario_id, entity_type),
             headers=self.header_payload, fields=fields)
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
-        return json.loads(response.data.decode(self.codec))
-
+        return self._decode(response)
+
+    def _paginate(self, method, page_size, offset, *args, **kwargs):
+        """ Yield the records of consecutive pages of a query while the next page is fetched in background.
+
+        :param method: The paginated method (it must accept limit and offset).
+        :param page_size: The limit used in each request.
+        :param offset: The offset of the first page.
+
+        :return: A generator of records
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(method, *args, limit=page_size, offset=offset, **kwargs)
+            while future:
+                with self._phase("wait"):
+                    page = future.result()
+                offset += len(page)
+                if len(page) < page_size:
+                    future = None
+                else:
+                    future = executor.submit(method, *args, limit=page_size, offset=offset, **kwargs)
+                yield from page
+
+    def entity_get_iter(self, scenario_id, entity_type, entity_id, since=None, until=None, page_size=1000, offset=0,
+                        attributes=None, query=None):
+        """ Iterate over all the history of an entity requesting it page by page. See entity_get."""
+        return self._paginate(self.entity_get, page_size, offset, scenario_id, entity_type, entity_id,
+                              since=since, until=until, attributes=attributes, query=query)
+
+    def entities_get_iter(self, scenario_id, entity_type, since=None, until=None, page_size=1000, offset=0,
+                          attributes=None, query=None):
+        """ Iterate over all the history of a entity type requesting it page by page. See entities_get."""
+        return self._paginate(self.entities_get, page_size, offset, scenario_id, entity_type,
+                              since=since, until=until, attributes=attributes, query=query)
+
+    def entity_list_by_type_iter(self, scenario_id, entity_type, since=None, until=None, page_size=1000, offset=0):
+        """ Iterate over all the entities of a type requesting them page by page. See entity_list_by_type."""
+        return self._paginate(self.entity_list_by_type, page_size, offset, scenario_id, entity_type,
+                              since=since, until=until)
+
+    @profiled
+    def fetch_range(self, scenario_id, entity_type, entity_id, since, until, window=timedelta(hours=1),
+                    max_workers=4, target_size=1000, min_window=timedelta(seconds=1), limit=9999,
+                    attributes=None, query=None, time_key="time"):
+        """ Get the history of an entity (or of all the entities of a type if entity_id is None) between two dates
+        splitting the interval in time windows that are requested concurrently.
+
+        The size of the window adapts to the density of the results so each request returns around target_size
+        records. Windows that reach the limit are split and requested again.
+
+        :param since: Start of the interval (datetime)
+        :param until: End of the interval (datetime)
+        :param window: Initial size of the time windows (timedelta)
+        :param max_workers: Maximum number of concurrent requests.
+        :param target_size: Desired amount of records per request.
+        :param min_window: Windows are not split under this size, they are paginated instead.
+        :param time_key: Key of the record timestamp, used to merge the results.
+
+        If the connector has a cache only the ranges that are not cached are requested.
+
+        :return: A list of records sorted by time
+        """
+        if self.cache is None:
+            return self._fetch_range(scenario_id, entity_type, entity_id, since, until, window, max_workers,
+                                     target_size, min_window, limit, attributes, query, time_key)
+
+        # The cache works with [start, until) ranges, since is exclusive
+        key = self.cache.key(scenario_id, entity_type, entity_id, attributes, query)
+        start = since + timedelta(microseconds=1)
+        for missing_since, missing_until in self.cache.missing(key, start, until):
+            logger.debug("Cache miss %s: %s-%s", key, missing_since, missing_until)
+            records = self._fetch_range(scenario_id, entity_type, entity_id,
+                                        missing_since - timedelta(microseconds=1), missing_until, window,
+                                        max_workers, target_size, min_window, limit, attributes, query, time_key)
+            self.cache.store(key, missing_since, missing_until, records, time_key)
+        return self.cache.get(key, start, until)
+
+    def _fetch_range(self, scenario_id, entity_type, entity_id, since, until, window, max_workers, target_size,
+                     min_window, limit, attributes, query, time_key):
+        def fetch(start, end, limit=limit, offset=0):
+            # Windows are [start, end), the first one keeps the exclusive since of entity_get
+            if start != since:
+                start -= timedelta(microseconds=1)
+            if entity_id is None:
+                return self.entities_get(scenario_id, entity_type, since=start, until=end, limit=limit,
+                                         offset=offset, attributes=attributes, query=query)
+            return self.entity_get(scenario_id, entity_type, entity_id, since=start, until=end, limit=limit,
+                                   offset=offset, attributes=attributes, query=query)
+
+        results = []
+        pending = deque()
+        cursor = since
+        futures = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                while len(futures) < max_workers:
+                    if pending:
+                        start, end = pending.popleft()
+                    elif cursor < until:
+                        start, end = cursor, min(cursor + window, until)
+                        cursor = end
+                    else:
+                        break
+                    futures[executor.submit(fetch, start, end)] = (start, end)
+                if not futures:
+                    break
+
+                with self._phase("wait"):
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end = futures.pop(future)
+                    records = future.result()
+                    if len(records) >= limit:
+                        if end - start > min_window:
+                            middle = start + (end - start) / 2
+                            pending.extend(((start, middle), (middle, end)))
+                            window = max(min(window, middle - start), min_window)
+                            continue
+                        records.extend(self._paginate(fetch, limit, len(records), start, end))
+                    results.extend(records)
+                    if records:
+                        density = len(records) / (end - start).total_seconds()
+                        window = max(timedelta(seconds=target_size / density), min_window)
+                    else:
+                        window = window * 2
+                    logger.debug("Window %s-%s: %s records, next window %s", start, end, len(records), window)
+
+        results.sort(key=lambda record: record[time_key])
+        return results
+
+    @profiled
+    def aggregate(self, scenario_id, entity_type, entity_id, since, until, attributes, freq="15min",
+                  funcs=("mean", "max"), time_key="time", **kwargs):
+        """ Get the history of the attributes resampled to fixed intervals. Requires numpy.
+
+        The records are retrieved with fetch_range (the extra arguments are passed to it) and aggregated with
+        vectorized numpy operations. The intervals are aligned to the epoch and the empty ones are kept as NaN.
+
+        Example:
+
+            history.aggregate("S1", "Room", "Room1", since, until, ["temperature"], freq="1h", funcs=["mean", "max"])
+
+        :param attributes: The attributes to aggregate.
+        :param freq: The interval length, as "<n><unit>" with unit in us, ms, s, min, h or d.
+        :param funcs: Aggregations to compute: "count", "sum", "mean", "min" and/or "max".
+
+        :return: A dict with the "time" array of the interval starts and a dict of arrays by function for each
+        attribute
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("aggregate requires numpy: pip install pyfiware[numpy]")
+
+        unknown = set(funcs) - {"count", "sum", "mean", "min", "max"}
+        if unknown:
+            raise ValueError("Unknown aggregation functions: {0}".format(", ".join(sorted(unknown))))
+        step = parse_frequency(freq)
+
+        records = self.fetch_range(scenario_id, entity_type, entity_id, since, until, attributes=attributes,
+                                   time_key=time_key, **kwargs)
+        if not records:
+            return {"time": np.array([], dtype="datetime64[us]"),
+                    **{attribute: {func: np.array([]) for func in funcs} for attribute in attributes}}
+
+        times = np.array([record[time_key].rstrip("Z") for record in records], dtype="datetime64[us]")
+        bins = times.astype(np.int64) // step
+        first = bins.min()
+        bins -= first
+        size = int(bins.max()) + 1
+
+        result = {"time": ((np.arange(size) + first) * step).astype("datetime64[us]")}
+        for attribute in attributes:
+            values = np.array([self._record_value(record, attribute) for record in records], dtype=float)
+            present = ~np.isnan(values)
+            counts = np.bincount(bins[present], minlength=size)
+            sums = np.bincount(bins[present], weights=values[present], minlength=size)
+            aggregations = {}
+            for func in funcs:
+                if func == "count":
+                    aggregations[func] = counts
+                elif func == "sum":
+                    aggregations[func] = sums
+                elif func == "mean":
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        aggregations[func] = sums / counts
+                else:
+                    extreme = np.full(size, np.nan)
+                    (np.fmin if func == "min" else np.fmax).at(extreme, bins[present], values[present])
+                    aggregations[func] = extreme
+            result[attribute] = aggregations
+        return result
+
+    @staticmethod
+    def _record_value(record, attribute):
+        value = record.get(attribute)
+        if isinstance(value, dict):
+            value = value.get("value")
+        return value if isinstance(value, (int, float)) else float("nan")
+
+    @profiled
     def entity_type_fist_time(self, scenario_id, entity_type):
-        response = self._pool_manager.request(method="GET", url="{0}/scenario/{1}/entities/{2}/min_time".format(
+        response = self._request(method="GET", url="{0}/scenario/{1}/entities/{2}/min_time".format(
             self.host, scenario_id, entity_type))
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
+    @profiled
     def entity_type_last_time(self, scenario_id, entity_type):
-        response = self._pool_manager.request(method="GET", url="{0}/scenario/{1}/entities/{2}/min_time".format(
+        response = self._request(method="GET", url="{0}/scenario/{1}/entities/{2}/min_time".format(
             self.host, scenario_id, entity_type))
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
-        return json.loads(response.data.decode(self.codec))
+        return self._decode(response)
 
+    @profiled
     def entity_create(self, scenario_id, **data):
-        response = self._pool_manager.request(
-            method="POST", url="{0}/scenario/{1}/entity".format(self.host, scenario_id), body=json.dumps(data),
+        response = self._request(
+            method="POST", url="{0}/scenario/{1}/entity".format(self.host, scenario_id), body=self._encode(data),
             headers=self.header_payload)
 
         if response.status // 200 != 1:
@@ -227,12 +487,136 @@ class HistoryConnector:
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
         return response.data
 
+    @profiled
     def entity_update(self, scenario_id, entity_type, entity_id, **data):
-        response = self._pool_manager.request(
+        response = self._request(
             method="PATCH", url="{0}/scenario/{1}/entity/{2}/{3}".format(self.host, scenario_id, entity_type, entity_id),
-            body=json.dumps(data), headers=self.header_payload)
+            body=self._encode(data), headers=self.header_payload)
 
         if response.status // 200 != 1:
             raise HistoryException(response.status,
                                    "Error{}: {}".format(response.status, response.data.decode(self.codec)))
         return response.data
+
+    @profiled
+    def entity_create_many(self, scenario_id, records, max_in_flight=8, retries=3, retry_delay=0.5):
+        """ Create many history records concurrently. The records are consumed lazily so a generator of any size
+        can be used with constant memory.
+
+        Failed requests with a server error (5xx or 429) are retried with exponential backoff.
+
+        :param scenario_id: The scenario of the records.
+        :param records: Iterable of dicts, each one is sent as in entity_create.
+        :param max_in_flight: Maximum number of concurrent requests.
+        :param retries: Amount of retries of each record.
+        :param retry_delay: Seconds to wait before the first retry, doubled on each retry.
+
+        :return: A dict with the amount of created and failed records, the seconds spent and the records per second
+        """
+        def create(record):
+            for attempt in range(retries + 1):
+                try:
+                    return self.entity_create(scenario_id, **record)
+                except HistoryException as ex:
+                    if attempt == retries or (ex.status // 100 != 5 and ex.status != 429):
+                        raise
+                    logger.debug("Retrying record after error %s", ex.status)
+                    sleep(retry_delay * 2 ** attempt)
+
+        stats = {"created": 0, "failed": 0}
+
+        def collect(done):
+            for future in done:
+                if future.exception():
+                    logger.warning("Unable to create record: %s", future.exception())
+                    stats["failed"] += 1
+                else:
+                    stats["created"] += 1
+
+        start = time()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = set()
+            for record in records:
+                if len(futures) >= max_in_flight:
+                    with self._phase("wait"):
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(done)
+                futures.add(executor.submit(create, record))
+            with self._phase("wait"):
+                done = wait(futures).done
+            collect(done)
+
+        stats["seconds"] = time() - start
+        stats["rate"] = (stats["created"] + stats["failed"]) / stats["seconds"] if stats["seconds"] else 0
+        logger.info("Created %s history records (%s failed) at %.1f records/s",
+                    stats["created"], stats["failed"], stats["rate"])
+        return stats
+
+
+class AsyncHistoryConnector:
+    """ Asyncio version of HistoryConnector.
+
+    The requests run on a thread pool shared by all the instances with the same transport and bounded to its
+    connections, so an event loop can launch hundreds of coroutines while only maxsize requests are in flight at
+    the same time. The pool is created with the first request.
+    """
+
+    # Transport -> ThreadPoolExecutor
+    _executors = WeakKeyDictionary()
+    _executors_lock = Lock()
+
+    def __init__(self, host, token, codec="utf-8", version="api", cache=None, transport=None, profiler=None):
+        self.connector = HistoryConnector(host, token, codec=codec, version=version, cache=cache,
+                                          transport=transport, profiler=profiler)
+
+    @property
+    def _executor(self):
+        transport = self.connector._transport
+        with self._executors_lock:
+            executor = self._executors.get(transport)
+            if executor is None:
+                executor = self._executors[transport] = ThreadPoolExecutor(
+                    max_workers=transport.maxsize or 16, thread_name_prefix="AsyncHistory")
+        return executor
+
+    async def _run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+    async def scenario_create(self, scenario_id):
+        return await self._run(self.connector.scenario_create, scenario_id)
+
+    async def scenario_socket_connect(self, scenario_id):
+        return await self._run(self.connector.scenario_socket_connect, scenario_id)
+
+    async def scenario_delete(self, scenario_id):
+        return await self._run(self.connector.scenario_delete, scenario_id)
+
+    async def scenario_socket_close(self, scenario_id):
+        return await self._run(self.connector.scenario_socket_close, scenario_id)
+
+    async def scenario_list(self, user_id=None):
+        return await self._run(self.connector.scenario_list, user_id=user_id)
+
+    async def scenario_get(self, scenario_id):
+        return await self._run(self.connector.scenario_get, scenario_id)
+
+    async def entity_list(self, scenario_id, since=None, until=None, limit=9999, offset=0):
+        return await self._run(self.connector.entity_list, scenario_id, since=since, until=until, limit=limit,
+                               offset=offset)
+
+    async def entity_get(self, scenario_id, entity_type, entity_id, since=None, until=None, limit=9999, offset=0,
+                         attributes=None, query=None):
+        return await self._run(self.connector.entity_get, scenario_id, entity_type, entity_id, since=since,
+                               until=until, limit=limit, offset=offset, attributes=attributes, query=query)
+
+    async def entities_get(self, scenario_id, entity_type, since=None, until=None, limit=9999, offset=0,
+                           attributes=None, query=None):
+        return await self._run(self.connector.entities_get, scenario_id, entity_type, since=since, until=until,
+                               limit=limit, offset=offset, attributes=attributes, query=query)
+
+    async def entity_create(self, scenario_id, **data):
+        return await self._run(self.connector.entity_create, scenario_id, **data)
+
+    async def entity_update(self, scenario_id, entity_type, entity_id, **data):
+        return await self._run(self.connector.entity_update, scenario_id, entity_type, entity_id, **data)
@@ -0,0 +1,104 @@
+""" Bulk loading of entities from CSV or NDJSON files.
+
+Each row is converted into an NGSI entity with the same type inference that OrionConnector.create uses and the
+entities are written with concurrent chunked batch_update calls under the limiter of the connector.
+"""
+import csv
+import json
+from logging import getLogger
+
+from pyfiware import ngsi_attribute
+
+logger = getLogger(__name__)
+
+
+def _reject_constant(name):
+    """ NaN and Infinity are not valid JSON, Orion rejects them."""
+    raise ValueError("Non finite number {0}".format(name))
+
+
+def parse_value(text):
+    """ Parse a CSV cell as a JSON literal (numbers, booleans, objects...) or keep it as a string."""
+    if text == "":
+        return None
+    try:
+        return json.loads(text, parse_constant=_reject_constant)
+    except ValueError:
+        return text
+
+
+def read_csv(path, encoding="utf-8", raw_columns=("id", "type")):
+    """ Yield the rows of a CSV file with header as dicts of parsed values.
+
+    :param raw_columns: Columns kept as strings, like the id and type columns (an id 1e3 is not 1000.0).
+    """
+    with open(path, newline="", encoding=encoding) as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield {key: value if key in raw_columns else parse_value(value) for key, value in row.items()}
+
+
+def read_ndjson(path, encoding="utf-8"):
+    """ Yield the objects of a newline delimited JSON file, NaN and Infinity are rejected."""
+    with open(path, encoding=encoding) as ndjson_file:
+        for line in ndjson_file:
+            if line.strip():
+                yield json.loads(line, parse_constant=_reject_constant)
+
+
+def read_rows(path, file_format=None, raw_columns=("id", "type")):
+    """ Yield the rows of a CSV or NDJSON file, the format is taken from the extension if not set."""
+    if file_format is None:
+        file_format = "csv" if path.lower().endswith(".csv") else "ndjson"
+    if file_format == "csv":
+        return read_csv(path, raw_columns=raw_columns)
+    return read_ndjson(path)
+
+
+def to_entity(row, entity_type=None, id_column="id", type_column="type", schemas=None):
+    """ Convert a row into an NGSI entity.
+
+    Values that already are NGSI attributes (dicts with value and type) are kept, the rest are typed like create
+    does. Empty values are skipped. With a SchemaRegistry the values are typed by the schema of the entity type
+    instead.
+    """
+    entity = {"id": str(row[id_column]), "type": row.get(type_column) or entity_type}
+    if entity["type"] is None:
+        raise ValueError("Row without type: {0}".format(entity["id"]))
+    if schemas is not None:
+        values = {}
+        attributes = {}
+        for key, value in row.items():
+            if key in (id_column, type_column) or value is None:
+                continue
+            if isinstance(value, dict) and "value" in value and "type" in value:
+                attributes[key] = value
+            else:
+                values[key] = value
+        entity = schemas.serialize(entity["id"], entity["type"], values)
+        entity.update(attributes)
+        return entity
+    for key, value in row.items():
+        if key in (id_column, type_column) or value is None:
+            continue
+        if isinstance(value, dict) and "value" in value and "type" in value:
+            entity[key] = value
+        else:
+            entity[key] = ngsi_attribute(value)
+    return entity
+
+
+def load(connector, rows, entity_type=None, id_column="id", type_column="type", action_type="append",
+         chunk_size=100, retries=3, progress=None):
+    """ Load rows into the context broker with concurrent chunked batch_update calls. The rows are typed with the
+    SchemaRegistry of the connector if it has one.
+
+    :param connector: The OrionConnector.
+    :param rows: An iterable of dicts, consumed lazily.
+    :param entity_type: The type of the rows without type column.
+    :param progress: Optional function called with the amount of rows loaded.
+
+    :return: The amount of rows loaded
+    """
+    entities = (to_entity(row, entity_type, id_column, type_column, connector.schemas) for row in rows)
+    return connector.batch_update_many(action_type, entities, chunk_size=chunk_size, progress=progress,
+                                       retries=retries)
@@ -0,0 +1,202 @@
+""" Synthetic device load generator.
+
+Simulates a fleet of devices that patch their attributes, send batch updates, and get and search entities at a
+fixed rate through an OrionConnector, and reports the achieved throughput, the latency percentiles and the error
+rates of each operation:
+
+    pyfiware loadgen http://127.0.0.1:1026 --entities 10000 --tenants 4 --rate 500 --duration 60 \\
+        --mix patch=80,batch_update=5,get=10,search=5
+    pyfiware loadgen fake --rate 2000           # In process FakeOrion, to measure the client alone
+
+The operations are scheduled at fixed intervals (open loop) and the latency is measured from the scheduled time,
+so the time waiting for a free worker when the broker or the client pool is saturated is included.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from random import Random
+from threading import Lock, Semaphore
+from time import sleep, time
+
+from pyfiware import FiException
+
+logger = getLogger(__name__)
+
+OPERATIONS = ("patch", "batch_update", "get", "search")
+DEFAULT_MIX = {"patch": 80, "batch_update": 5, "get": 10, "search": 5}
+
+
+def parse_mix(text):
+    """ Parse an operation mix like "patch=80,get=20" into a dict of weights."""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError("Unknown operation {0}, use {1}".format(name, ", ".join(OPERATIONS)))
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The operation mix has no weight")
+    return mix
+
+
+def percentile(values, fraction):
+    """ Nearest rank percentile of a sorted list."""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+class OperationStats:
+    """ Latencies and errors of an operation."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self._lock = Lock()
+
+    def add(self, latency, error=None):
+        with self._lock:
+            self.latencies.append(latency)
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+        errors = sum(self.errors.values())
+        return {
+            "count": len(latencies),
+            "errors": errors,
+            "error_rate": errors / len(latencies) if latencies else 0,
+            "error_types": dict(self.errors),
+            "throughput": len(latencies) / elapsed if elapsed else 0,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p90_ms": percentile(latencies, 0.9) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0) * 1000,
+        }
+
+
+class LoadGenerator:
+    """ Drives a mix of operations at a fixed rate over the entities of one or more tenants."""
+
+    def __init__(self, connector, entities=1000, tenants=1, entity_type="Device", mix=None, rate=100.0,
+                 batch_size=50, max_workers=16, tenant_prefix="loadgen", seed=None):
+        """ Initialize the generator.
+
+        :param connector: The OrionConnector.
+        :param entities: The amount of devices of each tenant.
+        :param tenants: The amount of tenants, the service of the connector if 1, else tenant_prefix0, 1...
+        :param mix: Dict of operation name to weight, DEFAULT_MIX if not set.
+        :param rate: The operations started per second.
+        :param batch_size: The entities of each batch_update and the limit of each search.
+        :param max_workers: The maximum operations in flight.
+        :param seed: Seed of the random choices, for repeatable runs.
+        """
+        if not rate > 0:
+            raise ValueError("The rate must be positive, not {0}".format(rate))
+        self.connector = connector
+        self.entities = entities
+        if tenants <= 1:
+            self.tenants = [connector]
+        else:
+            self.tenants = [connector.scoped(service="{0}{1}".format(tenant_prefix, index))
+                            for index in range(tenants)]
+        self.entity_type = entity_type
+        self.mix = mix or DEFAULT_MIX
+        self.rate = rate
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.random = Random(seed)
+
+    def entity_id(self, index):
+        return "{0}{1:08d}".format(self.entity_type, index)
+
+    def _entity(self, index, temperature=20.0):
+        return {"id": self.entity_id(index), "type": self.entity_type,
+                "temperature": {"value": temperature, "type": "Number"},
+                "status": {"value": "ok", "type": "Text"}}
+
+    def setup(self):
+        """ Create (or reset) the devices of every tenant."""
+        for tenant in self.tenants:
+            tenant.upsert_many((self._entity(index) for index in range(self.entities)), chunk_size=500, retries=3)
+
+    def _prepare(self, name):
+        """ Choose the arguments of an operation and return the function that runs it"""
+        tenant = self.random.choice(self.tenants)
+        temperature = round(self.random.uniform(10, 30), 2)
+        index = self.random.randrange(self.entities)
+        if name == "patch":
+            return lambda: tenant.patch(self.entity_id(index), self.entity_type,
+                                        temperature={"value": temperature, "type": "Number"})
+        if name == "batch_update":
+            indexes = self.random.sample(range(self.entities), min(self.batch_size, self.entities))
+            return lambda: tenant.batch_update("append", [self._entity(i, temperature) for i in indexes])
+        if name == "get":
+            return lambda: tenant.get(self.entity_id(index), self.entity_type)
+        return lambda: tenant.search(entity_type=self.entity_type, query="temperature>{0}".format(temperature),
+                                     limit=self.batch_size)
+
+    @staticmethod
+    def _run(stats, operation, scheduled, slots):
+        error = None
+        try:
+            operation()
+        except FiException as ex:
+            error = str(ex.status)
+        except Exception as ex:  # pylint: disable=broad-except
+            error = type(ex).__name__
+        finally:
+            stats.add(time() - scheduled, error)
+            slots.release()
+
+    def run(self, duration):
+        """ Run the load for duration seconds.
+
+        :return: A dict with the totals and the stats of each operation
+        """
+        names = [name for name, weight in self.mix.items() if weight]
+        weights = [self.mix[name] for name in names]
+        stats = {name: OperationStats() for name in names}
+        slots = Semaphore(self.max_workers)
+        count = 0
+        start = time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while count / self.rate < duration:
+                scheduled = start + count / self.rate
+                delay = scheduled - time()
+                if delay > 0:
+                    sleep(delay)
+                name = self.random.choices(names, weights)[0]
+                operation = self._prepare(name)
+                slots.acquire()
+                executor.submit(self._run, stats[name], operation, scheduled, slots)
+                count += 1
+        elapsed = time() - start
+
+        operations = {name: operation_stats.report(elapsed) for name, operation_stats in stats.items()}
+        errors = sum(report["errors"] for report in operations.values())
+        return {
+            "duration": elapsed,
+            "target_rate": self.rate,
+            "requests": count,
+            "throughput": count / elapsed if elapsed else 0,
+            "errors": errors,
+            "error_rate": errors / count if count else 0,
+            "operations": operations,
+        }
+
+
+def format_report(report):
+    """ Human readable table of a run report."""
+    lines = ["{0} operations in {1:.1f}s: {2:.1f}/s (target {3:.1f}/s), {4:.2%} errors".format(
+        report["requests"], report["duration"], report["throughput"], report["target_rate"], report["error_rate"]),
+        "{0:<14}{1:>9}{2:>10}{3:>9}{4:>10}{5:>10}{6:>10}{7:>10}".format(
+            "operation", "count", "rate/s", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms")]
+    for name, stats in sorted(report["operations"].items()):
+        lines.append("{0:<14}{1:>9}{2:>10.1f}{3:>9.2%}{4:>10.2f}{5:>10.2f}{6:>10.2f}{7:>10.2f}".format(
+            name, stats["count"], stats["throughput"], stats["error_rate"], stats["p50_ms"], stats["p90_ms"],
+            stats["p99_ms"], stats["max_ms"]))
+        for error, amount in sorted(stats["error_types"].items()):
+            lines.append("    error {0}: {1}".format(error, amount))
+    return "\n".join(lines)
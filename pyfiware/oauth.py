@@ -1,18 +1,71 @@
+import os
 from base64 import b64encode
-from json import loads
+from contextlib import contextmanager
+from json import dump, load, loads
 from logging import getLogger
+from threading import Event, Lock, Thread
 from time import time
 
-from urllib3 import PoolManager
+from pyfiware.transport import Urllib3Transport
 
 logger = getLogger(__name__)
 
 
+class FileTokenStore:
+    """ Token store shared by several processes through a locked JSON file.
+
+    Every OAuthManager that uses the same file and the same server, client and user reuses the
+    same token instead of login again. The refreshes are serialized with an exclusive file lock.
+    """
+
+    def __init__(self, path):
+        """ Initialize the store.
+
+        :param path: Path of the JSON file where the tokens are kept. A "<path>.lock" file is used as lock.
+        """
+        self.path = path
+        self.lock_path = path + ".lock"
+
+    @contextmanager
+    def lock(self):
+        """ Hold the exclusive lock of the store."""
+        import fcntl
+
+        with os.fdopen(os.open(self.lock_path, os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o600), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as store_file:
+                return load(store_file)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, key):
+        """ Get the token stored for a key or None."""
+        return self._read().get(key)
+
+    def save(self, key, data):
+        """ Store the token of a key. Must be called holding the lock."""
+        tokens = self._read()
+        tokens[key] = data
+        temp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+        # The tokens are credentials, only the owner may read them
+        with os.fdopen(os.open(temp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), "w") as store_file:
+            dump(tokens, store_file)
+        os.replace(temp_path, self.path)
+
+
 class OAuthManager:
 
     def __init__(self,  oauth_server_url=None, client_id=None, client_secret=None,
                  user=None, password=None, codec="utf-8", token=None,
-                 refresh_token=None, secure_lapse=10, scopes=None):
+                 refresh_token=None, secure_lapse=10, scopes=None, token_store=None,
+                 background_refresh=False, refresh_margin=30, retry_delay=5, transport=None):
         self.codec = codec
         self.oauth_server = oauth_server_url
         self.user = user
@@ -20,38 +73,82 @@ class OAuthManager:
         self._client_id = client_id
         self._client_secret = client_secret
         self._encode()
-        self.PM = PoolManager()
+        self.PM = transport if transport is not None else Urllib3Transport()
         self._bearer = None
         self._token = token
         self._refresh_token = refresh_token
         self._expiration = None
         self.secure_lapse = secure_lapse
         self.scopes = scopes
+        self.token_store = token_store
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self._lock = Lock()
+        self._refresher = None
+        self._stop_refresher = Event()
+        if background_refresh:
+            self.start_refresher()
 
     def _encode(self, ):
         self.packed_Auth = b64encode(bytes("{0}:{1}".format(
             self._client_id, self._client_secret), self.codec)).decode(self.codec)
 
+    @property
+    def store_key(self):
+        """ Key of the token in the shared token store"""
+        return "{0}|{1}|{2}".format(self.oauth_server, self._client_id, self.user)
+
     @property
     def token(self):
-        if self._token:
-            if self.expired:
-                try:
-                    self._refresh_orion()
-                except:
-                    self._login()
-        else:
-            self._login()
+        if not self._token or self.expired:
+            self._renew_locked()
         if self._bearer.lower() == "bearer":
             return f"Bearer {self._token}"
         return self._token
 
     @property
     def expired(self):
+        return self._expires_within(self.secure_lapse)
+
+    def _expires_within(self, lapse):
         if self._expiration is not None:
-            return time() >= self._expiration - self.secure_lapse
+            return time() >= self._expiration - lapse
         return False
 
+    def start_refresher(self):
+        """ Start a daemon thread that renews the token refresh_margin seconds before the secure lapse."""
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._stop_refresher.clear()
+        self._refresher = Thread(target=self._refresh_loop, name="OAuthRefresher", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        """ Stop the background refresher thread, if any."""
+        self._stop_refresher.set()
+        if self._refresher:
+            self._refresher.join()
+            self._refresher = None
+
+    def _refresh_loop(self):
+        while not self._stop_refresher.is_set():
+            try:
+                self._renew_locked(self.refresh_margin)
+            except Exception as ex:
+                logger.warning("Unable to refresh Auth token: %s", ex)
+                wait = self.retry_delay
+            else:
+                if not self._token or self.expired:
+                    # _login logs and swallows the transport errors
+                    logger.warning("Unable to refresh Auth token: no valid token after renew")
+                    wait = self.retry_delay
+                elif self._expiration is None:
+                    logger.debug("Token without expiration, refresher stopped")
+                    return
+                else:
+                    wait = max(self._expiration - self.secure_lapse - self.refresh_margin - time(), 1)
+            self._stop_refresher.wait(wait)
+
     @property
     def client_id(self):
         return self._client_id
@@ -70,6 +167,43 @@ class OAuthManager:
         self.client_secret = value
         self._encode()
 
+    def _renew(self):
+        if self._token:
+            try:
+                self._refresh_orion()
+            except:
+                self._login()
+        else:
+            self._login()
+
+    def _renew_locked(self, margin=0):
+        """ Renew the token if it expires within the margin, only one thread refresh it at a time."""
+        with self._lock:
+            if not self._token or self._expires_within(self.secure_lapse + margin):
+                if self.token_store:
+                    self._renew_shared(margin)
+                else:
+                    self._renew()
+
+    def _renew_shared(self, margin=0):
+        """ Renew the token through the token store, only one process refresh it at a time."""
+        with self.token_store.lock():
+            stored = self.token_store.load(self.store_key)
+            if stored:
+                self._bearer = stored["token_type"]
+                self._token = stored["access_token"]
+                self._refresh_token = stored["refresh_token"]
+                self._expiration = stored["expiration"]
+            if not self._token or self._expires_within(self.secure_lapse + margin):
+                self._renew()
+                if self._token:
+                    self.token_store.save(self.store_key, {
+                        "token_type": self._bearer,
+                        "access_token": self._token,
+                        "refresh_token": self._refresh_token,
+                        "expiration": self._expiration,
+                    })
+
     def _login(self):
 
         url = self.oauth_server + "/token"
@@ -0,0 +1,205 @@
+""" Optional profiling of the connector operations.
+
+A Profiler set in a connector times each public operation split in phases:
+
+* serialize: encoding the request body (JSON and compression).
+* network: sending the request and receiving the response through the transport.
+* decode: parsing the JSON of the response.
+* wait: waiting for the calls that the operation runs in a thread pool (the chunks of batch_update_many, the next
+  page of search_pages...).
+* build: the rest of the time of the operation, the code of pyfiware and the callbacks it runs.
+
+    profiler = Profiler(sample_rate=0.01, memory=True)
+    fiware_manager = OrionConnector(host, profiler=profiler)
+    ...
+    print(profiler.format_report())
+
+The phases are attributed to the innermost operation running in the thread. An operation called from another one
+in the same thread (the rest of the pages of search) is reported on its own and its time is not counted in the
+build phase of the caller. The operations run in a thread pool (the batch_update of each chunk of
+batch_update_many) are reported on their own too, and the caller counts the time it waits for them in its wait
+phase. A sample_rate fraction of the calls are also run under cProfile (and tracemalloc if memory is set), one call
+at a time, and aggregated in the report.
+"""
+import cProfile
+import io
+import pstats
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from logging import getLogger
+from random import random
+from threading import Lock, local
+from time import perf_counter
+
+logger = getLogger(__name__)
+
+PHASES = ("build", "serialize", "network", "decode", "wait")
+
+# Phase of the connectors without profiler
+NO_PHASE = nullcontext()
+
+
+def profiled(method):
+    """ Decorator of the public operations of a connector with a profiler attribute."""
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        with profiler.operation(name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Profiler:
+    """ Aggregated timings by operation and phase, with sampled cProfile and tracemalloc snapshots."""
+
+    def __init__(self, sample_rate=0.0, memory=False, top=20):
+        """ Initialize the profiler.
+
+        :param sample_rate: Fraction of the operations run under cProfile.
+        :param memory: Trace the memory allocations of the sampled operations with tracemalloc.
+        :param top: Amount of functions and allocation lines of the report.
+        """
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.top = top
+        self._local = local()
+        self._lock = Lock()
+        self._sample_lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """ Discard the collected data."""
+        with self._lock:
+            self._operations = {}
+            self._profile_stats = None
+            self._allocations = {}
+            self.samples = 0
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def operation(self, name):
+        """ Time an operation."""
+        stack = self._stack()
+        frame = {"phases": dict.fromkeys(PHASES[1:], 0.0), "nested": 0.0}
+        stack.append(frame)
+        sampled = (not stack[:-1] and self.sample_rate and random() < self.sample_rate and
+                   self._sample_lock.acquire(blocking=False))
+        profile = snapshot = None
+        if sampled:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler (a debugger, coverage...) is active
+                logger.debug("Unable to sample %s", name)
+                sampled = False
+                self._sample_lock.release()
+        if sampled and self.memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            snapshot = tracemalloc.take_snapshot()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1]["nested"] += elapsed
+            if sampled:
+                allocations = None
+                if self.memory:
+                    allocations = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                    if started_tracing:
+                        tracemalloc.stop()
+                profile.disable()
+                self._sample_lock.release()
+                self._add_sample(profile, allocations)
+            self._add(name, elapsed, frame)
+
+    @contextmanager
+    def phase(self, name):
+        """ Time a phase of the current operation, nothing is recorded outside an operation."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            stack = self._stack()
+            if stack:
+                stack[-1]["phases"][name] += perf_counter() - start
+
+    def _add(self, name, elapsed, frame):
+        phases = frame["phases"]
+        phases["build"] = max(elapsed - sum(phases.values()) - frame["nested"], 0.0)
+        with self._lock:
+            stats = self._operations.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0,
+                                                       "phases": dict.fromkeys(PHASES, 0.0)})
+            stats["calls"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+            for phase, phase_time in phases.items():
+                stats["phases"][phase] += phase_time
+
+    def _add_sample(self, profile, allocations):
+        with self._lock:
+            self.samples += 1
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(profile)
+            else:
+                self._profile_stats.add(profile)
+            for difference in allocations or ():
+                line = str(difference.traceback)
+                self._allocations[line] = self._allocations.get(line, 0) + difference.size_diff
+
+    def report(self):
+        """ Timings of each operation.
+
+        :return: A dict of operation name to calls, total, mean and max seconds and total seconds of each phase
+        """
+        with self._lock:
+            return {name: {"calls": stats["calls"], "total": stats["total"], "mean": stats["total"] / stats["calls"],
+                           "max": stats["max"], "phases": dict(stats["phases"])}
+                    for name, stats in self._operations.items()}
+
+    def allocations(self):
+        """ Lines with the largest net allocations in the sampled operations, as a list of (line, bytes)."""
+        with self._lock:
+            return sorted(self._allocations.items(), key=lambda item: -item[1])[:self.top]
+
+    def dump_stats(self, path):
+        """ Write the aggregated cProfile samples to a pstats file."""
+        with self._lock:
+            if self._profile_stats is not None:
+                self._profile_stats.dump_stats(path)
+
+    def format_report(self):
+        """ Human readable report of the timings and the samples."""
+        lines = ["{0:<20}{1:>8}{2:>11}{3:>11}{4:>10}{5:>10}{6:>10}{7:>10}{8:>10}".format(
+            "operation", "calls", "total s", "mean ms", "build%", "serial%", "network%", "decode%", "wait%")]
+        for name, stats in sorted(self.report().items(), key=lambda item: -item[1]["total"]):
+            shares = [100 * stats["phases"][phase] / stats["total"] if stats["total"] else 0 for phase in PHASES]
+            lines.append("{0:<20}{1:>8}{2:>11.3f}{3:>11.3f}{4:>10.1f}{5:>10.1f}{6:>10.1f}{7:>10.1f}{8:>10.1f}".format(
+                name, stats["calls"], stats["total"], stats["mean"] * 1000, *shares))
+        with self._lock:
+            if self._profile_stats is not None:
+                stream = io.StringIO()
+                self._profile_stats.stream = stream
+                self._profile_stats.sort_stats("cumulative").print_stats(self.top)
+                lines.append("\ncProfile of {0} sampled operations:".format(self.samples))
+                lines.append(stream.getvalue())
+        allocations = self.allocations()
+        if allocations:
+            lines.append("Allocations of the sampled operations:")
+            lines.extend("{0:>12} B  {1}".format(size, line) for line, size in allocations)
+        return "\n".join(lines)
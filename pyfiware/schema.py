@@ -0,0 +1,136 @@
+""" Registry of entity types with their attribute NGSI types.
+
+The attribute types of an entity type are declared once (or inferred from a first sample) and the bodies of the
+requests are built with a plain lookup instead of naming the type of every value (inferred schemas only check that
+each value has the type they were inferred from):
+
+    schemas = SchemaRegistry()
+    schemas.register("Room", {"temperature": "Float", "pressure": "Integer"})
+    fiware_manager = OrionConnector(host, schemas=schemas)
+    fiware_manager.create("Room1", "Room", temperature=21.5, pressure=720)
+    fiware_manager.batch_update_many("append", schemas.serialize_many("Room", rows))
+"""
+from logging import getLogger
+from threading import Lock
+
+from pyfiware import ngsi_attribute, ngsi_type
+
+logger = getLogger(__name__)
+
+
+class EntitySchema:
+    """ Attribute names and NGSI types of an entity type."""
+
+    def __init__(self, entity_type, attributes, python_types=None):
+        """ Initialize the schema.
+
+        :param entity_type: The entity type.
+        :param attributes: Dict of attribute name to NGSI type.
+        :param python_types: Dict of attribute name to the Python type the NGSI type was inferred from. Values of
+            other types are typed one by one, except int values in Float attributes, and Integer attributes are
+            widened to Float with the first float value.
+        """
+        self.entity_type = entity_type
+        self.attributes = dict(attributes)
+        self.python_types = python_types
+
+    @classmethod
+    def from_sample(cls, entity_type, sample):
+        """ Infer the schema from the Python values of an entity (None values are left undeclared)."""
+        values = {name: value for name, value in sample.items() if value is not None}
+        return cls(entity_type, {name: ngsi_type(value) for name, value in values.items()},
+                   {name: type(value) for name, value in values.items()})
+
+    def serialize(self, entity_id, values):
+        """ Build the NGSI entity of the values. Undeclared attributes are typed like create does.
+
+        :param entity_id: The ID of the entity.
+        :param values: Dict of attribute name to Python value.
+
+        :return: The NGSI entity
+        """
+        body = {"id": entity_id, "type": self.entity_type}
+        types = self.attributes
+        python_types = self.python_types
+        for name, value in values.items():
+            attribute_type = types.get(name)
+            if attribute_type is not None and python_types is not None:
+                expected, actual = python_types.get(name), type(value)
+                if expected is int and actual is float:
+                    types[name] = attribute_type = "Float"
+                    python_types[name] = float
+                elif actual is not expected and not (expected is float and actual is int):
+                    attribute_type = None
+            if attribute_type is None:
+                body[name] = ngsi_attribute(value)
+            else:
+                body[name] = {"value": value, "type": attribute_type}
+        return body
+
+
+class SchemaRegistry:
+    """ Schemas of the entity types, the types not registered are inferred from their first entity."""
+
+    def __init__(self, infer=True):
+        """ Initialize the registry.
+
+        :param infer: Infer the schema of an unregistered type from its first entity, else the values are typed
+            one by one.
+        """
+        self.infer = infer
+        self._schemas = {}
+        self._lock = Lock()
+
+    def register(self, entity_type, attributes):
+        """ Declare the attributes of an entity type.
+
+        :param entity_type: The entity type.
+        :param attributes: Dict of attribute name to NGSI type.
+
+        :return: The EntitySchema
+        """
+        schema = EntitySchema(entity_type, attributes)
+        with self._lock:
+            self._schemas[entity_type] = schema
+        return schema
+
+    def get(self, entity_type, sample=None):
+        """ Get the schema of an entity type, inferred from sample if it is not registered.
+
+        :return: The EntitySchema or None
+        """
+        schema = self._schemas.get(entity_type)
+        if schema is None and self.infer and sample is not None:
+            with self._lock:
+                schema = self._schemas.get(entity_type)
+                if schema is None:
+                    schema = self._schemas[entity_type] = EntitySchema.from_sample(entity_type, sample)
+                    logger.debug("Inferred schema of %s: %s", entity_type, schema.attributes)
+        return schema
+
+    def serialize(self, entity_id, entity_type, values):
+        """ Build the NGSI entity of the values of an entity.
+
+        :param entity_id: The ID of the entity.
+        :param entity_type: The entity type.
+        :param values: Dict of attribute name to Python value.
+
+        :return: The NGSI entity
+        """
+        schema = self.get(entity_type, values)
+        if schema is None:
+            return dict({name: ngsi_attribute(value) for name, value in values.items()},
+                        id=entity_id, type=entity_type)
+        return schema.serialize(entity_id, values)
+
+    def serialize_many(self, entity_type, rows, id_key="id"):
+        """ Yield the NGSI entities of dicts of values, for batch_update or batch_update_many.
+
+        :param entity_type: The entity type.
+        :param rows: An iterable of dicts with the ID of the entity in id_key and the values of the attributes.
+        :param id_key: The key of the ID of the entity.
+        """
+        for row in rows:
+            values = dict(row)
+            entity_id = values.pop(id_key)
+            yield self.serialize(entity_id, entity_type, values)
@@ -0,0 +1,527 @@
+""" In memory fake of the Orion NGSIv2 API for tests and local benchmarks.
+
+It implements the subset of the API used by pyfiware: entities (with type, id, idPattern, q, attrs, keyValues and
+paging with fiware-total-count), entity attributes, types, op/update, op/query and subscriptions, separated by
+Fiware-Service and Fiware-ServicePath (including lists and /# hierarchical scopes).
+
+    fake = FakeOrion()
+    fiware_manager = fake.connector(service="tenant")        # In process, through a MemoryTransport
+    fiware_manager = OrionConnector(fake.serve())             # Or over HTTP on a local port
+    ...
+    fake.shutdown()
+
+Notifications are not sent, the ones that Orion would send are recorded in FakeOrion.notifications. The
+integration tests of test/integration pass against FakeOrion().serve(port=1026).
+Geographical queries and the rest of the q syntax (attribute paths, metadata filters...) are not supported.
+"""
+import gzip
+import json
+import re
+from copy import deepcopy
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from threading import Lock, Thread
+from urllib.parse import unquote
+from uuid import uuid4
+
+from pyfiware import OrionConnector
+from pyfiware.transport import MemoryRequest, MemoryTransport
+
+logger = getLogger(__name__)
+
+QUERY_STATEMENT = re.compile(r"^([^=!<>~]+)(==|!=|>=|<=|>|<|~=)(.*)$")
+# Characters that Orion rejects in the ids, types and attribute names of the URIs
+FORBIDDEN_CHARACTERS = re.compile(r"[<>\"'=;()]")
+EXPIRES = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?Z?$")
+
+
+class FakeOrionError(Exception):
+    """ Error response of the fake broker"""
+    def __init__(self, status, error, description):
+        super().__init__(status, error, description)
+        self.status = status
+        self.error = error
+        self.description = description
+
+
+def not_found(description="The requested entity has not been found. Check type and id"):
+    return FakeOrionError(404, "NotFound", description)
+
+
+def attribute_type(value):
+    """ Type that Orion gives to an attribute without type"""
+    if isinstance(value, bool):
+        return "Boolean"
+    if isinstance(value, (int, float)):
+        return "Number"
+    if isinstance(value, str):
+        return "Text"
+    if value is None:
+        return "None"
+    return "StructuredValue"
+
+
+def normalize(attribute):
+    """ Full NGSI attribute with value, type and metadata"""
+    if not isinstance(attribute, dict):
+        attribute = {"value": attribute}
+    value = attribute.get("value")
+    return {"type": attribute.get("type") or attribute_type(value), "value": deepcopy(value),
+            "metadata": deepcopy(attribute.get("metadata") or {})}
+
+
+def parse_literal(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == "'":
+        return text[1:-1]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def matches_statement(entity, statement):
+    if statement.startswith("!"):
+        return statement[1:] not in entity
+    match = QUERY_STATEMENT.match(statement)
+    if not match:
+        return statement in entity
+    name, operator, text = (group.strip() for group in match.groups())
+    if name not in entity:
+        return False
+    value = entity[name]["value"]
+    try:
+        if operator == "~=":
+            return isinstance(value, str) and re.search(text, value) is not None
+        if operator in ("==", "!="):
+            if ".." in text:
+                low, high = (parse_literal(part) for part in text.split("..", 1))
+                found = low <= value <= high
+            else:
+                found = any(value == parse_literal(part) for part in text.split(","))
+            return found if operator == "==" else not found
+        literal = parse_literal(text)
+        return {">": value > literal, "<": value < literal, ">=": value >= literal, "<=": value <= literal}[operator]
+    except TypeError:
+        return False
+
+
+def matches_query(entity, query):
+    """ Whether an entity matches a simple q expression (statements separated by ;)"""
+    return all(matches_statement(entity, statement.strip()) for statement in query.split(";") if statement.strip())
+
+
+def check_characters(*texts):
+    """ Reject the texts with characters that Orion forbids in URIs"""
+    for text in texts:
+        if text and FORBIDDEN_CHARACTERS.search(text):
+            raise FakeOrionError(400, "BadRequest", "invalid character in URI")
+
+
+def normalize_expires(expires):
+    """ Expiration date with milliseconds as Orion renders it, and whether it has already passed"""
+    match = EXPIRES.match(expires or "")
+    if not match:
+        raise FakeOrionError(400, "BadRequest", "expires has an invalid format")
+    seconds, fraction = match.groups()
+    expired = datetime.strptime(seconds + "+0000", "%Y-%m-%dT%H:%M:%S%z") < datetime.now(timezone.utc)
+    return "{0}.{1}Z".format(seconds, (fraction or "").ljust(3, "0")[:3]), expired
+
+
+def render_subscription(subscription):
+    """ Subscription as returned by Orion, with the defaults filled in"""
+    rendered = deepcopy(subscription)
+    subject = rendered.setdefault("subject", {})
+    if "condition" in subject:
+        subject["condition"].setdefault("attrs", [])
+    notification = rendered.setdefault("notification", {})
+    notification.setdefault("attrs", [])
+    notification.setdefault("attrsFormat", "normalized")
+    notification.setdefault("onlyChangedAttrs", False)
+    if "expires" in rendered:
+        rendered["expires"], expired = normalize_expires(rendered["expires"])
+        if expired:
+            rendered["status"] = "expired"
+    return rendered
+
+
+def render(entity, attrs=None, key_values=False):
+    """ Entity as returned by Orion, with only the attrs requested"""
+    rendered = {"id": entity["id"], "type": entity["type"]}
+    for name, attribute in entity.items():
+        if name in ("id", "type") or (attrs and name not in attrs):
+            continue
+        rendered[name] = deepcopy(attribute["value"] if key_values else attribute)
+    return rendered
+
+
+class FakeOrion:
+    """ In memory NGSIv2 context broker."""
+
+    host = "http://fake-orion"
+
+    def __init__(self):
+        # Service -> (service path, id, type) -> entity
+        self.entities = {}
+        # Service -> id -> subscription
+        self.subscriptions = {}
+        self.notifications = []
+        self.requests = 0
+        self._lock = Lock()
+        self._server = None
+
+    def transport(self):
+        """ A MemoryTransport served by this broker"""
+        return MemoryTransport(self.handle)
+
+    def connector(self, **kwargs):
+        """ An OrionConnector that sends its requests to this broker in process"""
+        return OrionConnector(self.host, transport=self.transport(), **kwargs)
+
+    def serve(self, host="127.0.0.1", port=0):
+        """ Serve the broker over HTTP in a background thread.
+
+        :param port: The port, a free one if 0.
+
+        :return: The url of the broker
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else None
+                status, headers, data = fake.handle(MemoryRequest(self.command, self.path, dict(self.headers), body))
+                data = data.encode("utf-8")
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, str(value))
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return "http://{0}:{1}".format(*self._server.server_address[:2])
+
+    def shutdown(self):
+        """ Stop the HTTP server"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def handle(self, request):
+        """ Answer a MemoryRequest.
+
+        :return: A tuple of status, headers and body
+        """
+        if request.body and request.headers.get("Content-Encoding", "").lower() == "gzip":
+            request.body = gzip.decompress(request.body)
+        with self._lock:
+            self.requests += 1
+            try:
+                status, headers, data = self._route(request)
+            except FakeOrionError as ex:
+                status, headers, data = ex.status, {}, {"error": ex.error, "description": ex.description}
+            except (ValueError, KeyError, AttributeError, TypeError) as ex:
+                status, headers, data = 400, {}, {"error": "BadRequest", "description": str(ex)}
+        if data is None:
+            return status, headers, ""
+        headers["Content-Type"] = "application/json"
+        return status, headers, json.dumps(data)
+
+    # Routing
+
+    def _route(self, request):
+        parts = [unquote(part) for part in request.path.rstrip("/").split("/")[1:]]
+        if parts[:1] != ["v2"] or len(parts) < 2:
+            raise not_found("Service not found. Check your URL as probably it is wrong.")
+        resource, method = parts[1:], request.method
+        body = json.loads(request.body.decode("utf-8")) if request.body else None
+        service = request.headers.get("Fiware-Service", "").lower()
+        service_paths = [path.strip() for path in request.headers.get("Fiware-ServicePath", "").split(",")
+                         if path.strip()]
+        store = self.entities.setdefault(service, {})
+        check_characters(request.query.get("id"), request.query.get("type"), request.query.get("attrs"))
+
+        if resource[0] == "entities":
+            check_characters(*resource[1:])
+            if len(resource) == 1 and method == "GET":
+                entities = self._filter(store, self._read_scopes(service_paths), request.query)
+                return self._page(entities, request.query)
+            if len(resource) == 1 and method == "POST":
+                upsert = "upsert" in request.query.get("options", "")
+                return self._create(service, store, self._write_path(service_paths), body, upsert)
+            entity_id = resource[1]
+            if len(resource) == 2 and method == "GET":
+                key = self._find(store, entity_id, request.query.get("type"), self._read_scopes(service_paths))
+                return 200, {}, self._render_one(store[key], request.query)
+            if method == "DELETE":
+                # Like Orion, a single hierarchical scope finds the entity to delete in the sub paths
+                scopes = service_paths if len(service_paths) == 1 else [self._write_path(service_paths)]
+            else:
+                scopes = [self._write_path(service_paths)]
+            key = self._find(store, entity_id, request.query.get("type"), scopes)
+            if len(resource) == 2 and method == "DELETE":
+                del store[key]
+                return 204, {}, None
+            if len(resource) == 3 and resource[2] == "attrs":
+                if method == "GET":
+                    return 200, {}, {name: value for name, value in
+                                     self._render_one(store[key], request.query).items() if name not in ("id", "type")}
+                action = {"POST": "appendStrict" if "append" in request.query.get("options", "") else "append",
+                          "PATCH": "update", "PUT": "replace"}.get(method)
+                if action:
+                    self._apply(service, store, key, action, body)
+                    return 204, {}, None
+            if len(resource) == 4 and resource[2] == "attrs" and method == "DELETE":
+                if resource[3] not in store[key] or resource[3] in ("id", "type"):
+                    raise not_found("The entity does not have such an attribute")
+                del store[key][resource[3]]
+                return 204, {}, None
+
+        elif resource == ["types"] and method == "GET":
+            return self._types(store, self._read_scopes(service_paths), request.query)
+
+        elif resource == ["op", "update"] and method == "POST":
+            self._batch_update(service, store, self._write_path(service_paths), body)
+            return 204, {}, None
+
+        elif resource == ["op", "query"] and method == "POST":
+            return self._batch_query(store, self._read_scopes(service_paths), body, request.query)
+
+        elif resource[0] == "subscriptions":
+            return self._subscription_route(self.subscriptions.setdefault(service, {}), resource[1:], method,
+                                            body, request.query)
+
+        raise FakeOrionError(405, "MethodNotAllowed", "Method not allowed")
+
+    # Service paths
+
+    @staticmethod
+    def _read_scopes(service_paths):
+        return service_paths or ["/#"]
+
+    @staticmethod
+    def _write_path(service_paths):
+        if not service_paths:
+            return "/"
+        if len(service_paths) > 1 or service_paths[0].endswith("#"):
+            raise FakeOrionError(400, "BadRequest", "a single non hierarchical service path must be used in updates")
+        return service_paths[0]
+
+    @staticmethod
+    def _in_scope(path, scopes):
+        for scope in scopes:
+            if scope.endswith("/#"):
+                base = scope[:-2]
+                if not base or path == base or path.startswith(base + "/"):
+                    return True
+            elif path == scope:
+                return True
+        return False
+
+    # Entities
+
+    def _find(self, store, entity_id, entity_type, scopes):
+        keys = [key for key in store if key[1] == entity_id and (not entity_type or key[2] == entity_type) and
+                self._in_scope(key[0], scopes)]
+        if not keys:
+            raise not_found()
+        if len(keys) > 1:
+            raise FakeOrionError(409, "TooManyResults", "More than one matching entity. Please refine your query")
+        return keys[0]
+
+    def _filter(self, store, scopes, query):
+        ids = set(query["id"].split(",")) if query.get("id") else None
+        types = set(query["type"].split(",")) if query.get("type") else None
+        id_pattern = re.compile(query["idPattern"]) if query.get("idPattern") else None
+        return [entity for key, entity in store.items()
+                if self._in_scope(key[0], scopes) and
+                (ids is None or key[1] in ids) and
+                (types is None or key[2] in types) and
+                (id_pattern is None or id_pattern.search(key[1])) and
+                (not query.get("q") or matches_query(entity, query["q"]))]
+
+    @staticmethod
+    def _attrs(query):
+        return set(query["attrs"].split(",")) if query.get("attrs") else None
+
+    def _render_one(self, entity, query):
+        return render(entity, self._attrs(query), "keyValues" in query.get("options", ""))
+
+    def _page(self, entities, query):
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+        if not 0 < limit <= 1000:
+            raise FakeOrionError(400, "BadRequest", "Bad pagination limit: /{0}/ [max: 1000]".format(limit))
+        headers = {}
+        if "count" in query.get("options", ""):
+            headers["Fiware-Total-Count"] = len(entities)
+        return 200, headers, [self._render_one(entity, query) for entity in entities[offset:offset + limit]]
+
+    def _create(self, service, store, service_path, body, upsert):
+        entity_id, entity_type = body.get("id"), body.get("type") or "Thing"
+        if not entity_id:
+            raise FakeOrionError(400, "BadRequest", "entity id length: 0, min length supported: 1")
+        check_characters(entity_id, entity_type)
+        key = (service_path, entity_id, entity_type)
+        if key in store:
+            if not upsert:
+                raise FakeOrionError(422, "Unprocessable", "Already Exists")
+            self._apply(service, store, key, "append", body)
+            return 204, {}, None
+        self._apply(service, store, key, "create", body)
+        return 201, {"Location": "/v2/entities/{0}?type={1}".format(entity_id, entity_type)}, None
+
+    def _apply(self, service, store, key, action, attributes):
+        """ Apply an update action to the attributes of an entity"""
+        attributes = {name: value for name, value in attributes.items() if name not in ("id", "type")}
+        if action == "create":
+            store[key] = {"id": key[1], "type": key[2]}
+        entity = store[key]
+        existing = set(entity) - {"id", "type"}
+        if action == "appendStrict" and existing & set(attributes):
+            raise FakeOrionError(422, "Unprocessable", "one or more of the attributes in the request already exist: "
+                                 + ", ".join(sorted(existing & set(attributes))))
+        if action == "update" and set(attributes) - existing:
+            raise FakeOrionError(422, "Unprocessable", "do not exist: " + ", ".join(sorted(set(attributes) - existing)))
+        if action == "replace":
+            for name in existing:
+                del entity[name]
+        for name, attribute in attributes.items():
+            entity[name] = normalize(attribute)
+        self._notify(service, entity, attributes)
+
+    def _types(self, store, scopes, query):
+        types = {}
+        for key, entity in store.items():
+            if self._in_scope(key[0], scopes):
+                entity_types = types.setdefault(key[2], {"type": key[2], "attrs": {}, "count": 0})
+                entity_types["count"] += 1
+                for name, attribute in entity.items():
+                    if name not in ("id", "type"):
+                        entity_types["attrs"].setdefault(name, {"types": []})
+                        if attribute["type"] not in entity_types["attrs"][name]["types"]:
+                            entity_types["attrs"][name]["types"].append(attribute["type"])
+        result = [types[name] for name in sorted(types)]
+        if "values" in query.get("options", ""):
+            result = [entity_types["type"] for entity_types in result]
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+        headers = {"Fiware-Total-Count": len(result)} if "count" in query.get("options", "") else {}
+        return 200, headers, result[offset:offset + limit]
+
+    def _batch_update(self, service, store, service_path, body):
+        action = body["actionType"]
+        if action not in ("append", "appendStrict", "update", "replace", "delete"):
+            raise FakeOrionError(400, "BadRequest", "invalid update action type: " + str(action))
+        for entity in body["entities"]:
+            if action in ("append", "appendStrict"):
+                key = (service_path, entity["id"], entity.get("type") or "Thing")
+                self._apply(service, store, key, action if key in store else "create", entity)
+                continue
+            key = self._find(store, entity["id"], entity.get("type"), [service_path])
+            if action != "delete":
+                self._apply(service, store, key, action, entity)
+            elif set(entity) - {"id", "type"}:
+                for name in set(entity) - {"id", "type"}:
+                    store[key].pop(name, None)
+            else:
+                del store[key]
+
+    def _batch_query(self, store, scopes, body, query):
+        body = body or {}
+        selectors = body.get("entities") or [{"idPattern": ".*"}]
+        matched = []
+        for key, entity in store.items():
+            if not self._in_scope(key[0], scopes):
+                continue
+            for selector in selectors:
+                if (("id" not in selector or selector["id"] == key[1]) and
+                        ("idPattern" not in selector or re.search(selector["idPattern"], key[1])) and
+                        ("type" not in selector or selector["type"] == key[2]) and
+                        ("typePattern" not in selector or re.search(selector["typePattern"], key[2]))):
+                    matched.append(entity)
+                    break
+        expression = body.get("expression") or {}
+        if expression.get("q"):
+            matched = [entity for entity in matched if matches_query(entity, expression["q"])]
+        if body.get("attrs"):
+            query = dict(query, attrs=",".join(body["attrs"]))
+        return self._page(matched, dict(query, limit=query.get("limit", 20)))
+
+    # Subscriptions
+
+    def _subscription_route(self, subscriptions, resource, method, body, query):
+        if not resource and method == "GET":
+            subscriptions = list(subscriptions.values())
+            limit = int(query.get("limit", 20))
+            offset = int(query.get("offset", 0))
+            headers = {"Fiware-Total-Count": len(subscriptions)} if "count" in query.get("options", "") else {}
+            return 200, headers, [render_subscription(subscription)
+                                  for subscription in subscriptions[offset:offset + limit]]
+        if not resource and method == "POST":
+            self._check_subscription(body)
+            subscription_id = uuid4().hex[:24]
+            subscriptions[subscription_id] = dict(deepcopy(body), id=subscription_id, status=body.get("status", "active"))
+            return 201, {"Location": "/v2/subscriptions/" + subscription_id}, None
+        if len(resource) == 1:
+            if resource[0] not in subscriptions:
+                raise not_found("The requested subscription has not been found. Check id")
+            if method == "GET":
+                return 200, {}, render_subscription(subscriptions[resource[0]])
+            if method == "PATCH":
+                self._check_subscription(dict(subscriptions[resource[0]], **body))
+                subscriptions[resource[0]].update(deepcopy(body))
+                return 204, {}, None
+            if method == "DELETE":
+                del subscriptions[resource[0]]
+                return 204, {}, None
+        raise FakeOrionError(405, "MethodNotAllowed", "Method not allowed")
+
+    @staticmethod
+    def _check_subscription(subscription):
+        """ Validate a subscription like Orion does"""
+        entities = (subscription.get("subject") or {}).get("entities")
+        if not entities:
+            raise FakeOrionError(400, "BadRequest", "no subject entities specified")
+        for selector in entities:
+            if "id" not in selector and "idPattern" not in selector:
+                raise FakeOrionError(400, "BadRequest", "subject entities element has no id nor idPattern")
+        notification = subscription.get("notification") or {}
+        if "http" not in notification and "httpCustom" not in notification:
+            raise FakeOrionError(400, "BadRequest", "http notification is missing")
+        if "expires" in subscription:
+            normalize_expires(subscription["expires"])
+
+    def _notify(self, service, entity, attributes):
+        """ Record the notifications of the subscriptions triggered by a change of attributes"""
+        for subscription in self.subscriptions.get(service, {}).values():
+            if subscription.get("status") != "active" or (
+                    "expires" in subscription and normalize_expires(subscription["expires"])[1]):
+                continue
+            subject = subscription.get("subject", {})
+            if not any(("id" not in selector or selector["id"] == entity["id"]) and
+                       ("idPattern" not in selector or re.search(selector["idPattern"], entity["id"])) and
+                       ("type" not in selector or selector["type"] == entity["type"])
+                       for selector in subject.get("entities", [])):
+                continue
+            condition_attributes = subject.get("condition", {}).get("attrs")
+            if condition_attributes and not set(condition_attributes) & set(attributes):
+                continue
+            notification = subscription.get("notification", {})
+            self.notifications.append({
+                "subscriptionId": subscription["id"],
+                "data": [render(entity, set(notification.get("attrs") or []),
+                                notification.get("attrsFormat") == "keyValues")]})
@@ -0,0 +1,123 @@
+""" HTTP transports used by the connectors to send their requests.
+
+A transport has a single method with the signature of urllib3 PoolManager.request:
+
+    transport.request(method, url, fields=None, headers=None, body=None, preload_content=True,
+                      decode_content=True)
+
+The contract that the connectors rely on:
+
+* fields are the query parameters of GET and DELETE requests, body is a str or bytes.
+* The response has status, headers (case insensitive get) and, when preload_content is True, the whole body in data.
+* When preload_content is False the body is consumed with read(decode_content=...) or
+  stream(amount, decode_content=...) and release_conn() must be called once it is consumed, so the connection
+  returns to the pool. With decode_content False a compressed body is returned as received.
+* A transport is shared by all the instances of a connector class and used from several threads at once, so
+  request must be thread safe and should reuse its connections. maxsize is the amount of connections kept per
+  host (None if unbounded), the concurrent methods use it to size their thread pools.
+"""
+from abc import ABC, abstractmethod
+from http.client import HTTPMessage
+from logging import getLogger
+from threading import Lock
+from urllib.parse import parse_qsl, urlsplit
+
+from urllib3 import PoolManager
+
+logger = getLogger(__name__)
+
+
+class Transport(ABC):
+    """ Interface of the transports."""
+
+    maxsize = None
+
+    @abstractmethod
+    def request(self, method, url, fields=None, headers=None, body=None, preload_content=True,
+                decode_content=True):
+        """ Send a request and return its response, see the contract of the module."""
+
+
+class Urllib3Transport(Transport):
+    """ Transport over a urllib3 PoolManager, the default one."""
+
+    def __init__(self, pool_manager=None, **pool_kwargs):
+        """ Initialize the transport.
+
+        :param pool_manager: The PoolManager (or ProxyManager) used, a new one created with pool_kwargs if not set.
+        """
+        self.pool_manager = pool_manager or PoolManager(**pool_kwargs)
+
+    @property
+    def maxsize(self):
+        return self.pool_manager.connection_pool_kw.get("maxsize")
+
+    def request(self, method, url, fields=None, headers=None, body=None, preload_content=True,
+                decode_content=True):
+        return self.pool_manager.request(method=method, url=url, fields=fields, headers=headers, body=body,
+                                         preload_content=preload_content, decode_content=decode_content)
+
+
+class MemoryRequest:
+    """ A request received by a MemoryTransport handler."""
+
+    def __init__(self, method, url, headers, body, fields=None):
+        self.method = method
+        self.url = url
+        parts = urlsplit(url)
+        self.path = parts.path
+        self.query = dict(parse_qsl(parts.query))
+        if fields:
+            self.query.update((str(key), str(value)) for key, value in fields.items())
+        self.headers = HTTPMessage()
+        for key, value in (headers or {}).items():
+            self.headers[key] = value
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+
+
+class MemoryResponse:
+    """ Response of a MemoryTransport, with the same interface as the urllib3 responses used by the connectors."""
+
+    def __init__(self, status, headers=None, data=b""):
+        self.status = status
+        self.headers = HTTPMessage()
+        for key, value in (headers or {}).items():
+            self.headers[key] = str(value)
+        self.data = data.encode("utf-8") if isinstance(data, str) else (data or b"")
+        self._position = 0
+
+    def read(self, amt=None, decode_content=True):
+        end = len(self.data) if amt is None else self._position + amt
+        chunk = self.data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+    def stream(self, amt=64 * 1024, decode_content=True):
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+    def release_conn(self):
+        pass
+
+
+class MemoryTransport(Transport):
+    """ Transport that answers the requests in process with a handler, for tests and benchmarks without network.
+
+    The handler receives a MemoryRequest and returns a tuple of status, headers and body. Bodies are never
+    compressed, so the responses are the same whatever decode_content is.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = 0
+        self._lock = Lock()
+
+    def request(self, method, url, fields=None, headers=None, body=None, preload_content=True,
+                decode_content=True):
+        with self._lock:
+            self.requests += 1
+        status, response_headers, data = self.handler(MemoryRequest(method, url, headers, body, fields))
+        return MemoryResponse(status, response_headers, data)
@@ -39,4 +39,13 @@ setup(
 
     packages=['pyfiware'],
     install_requires=['urllib3'],
+    extras_require={
+        'numpy': ['numpy'],
+        'export': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': [
+            'pyfiware=pyfiware.cli:main',
+        ],
+    },
 )
@@ -0,0 +1,159 @@
+# pylint: disable=no-member
+
+import io
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from pyfiware import OrionConnector
+from pyfiware.cli import main, read_part
+from pyfiware.loader import read_rows
+from pyfiware.testing import FakeOrion
+from test.mock.test_fiware_entities import DummyResponse
+
+
+class Store:
+    """ Serves types, entity pages and batch updates from a list of entities"""
+    def __init__(self, entities):
+        self.entities = entities
+
+    def request(self, method, url, fields=None, body=None, **kwargs):
+        if url.endswith("/v2/types"):
+            types = sorted({entity["type"] for entity in self.entities})
+            return DummyResponse(status=200, data=json.dumps(types), headers={"fiware-total-count": len(types)})
+        if url.endswith("/v2/entities"):
+            selected = [entity for entity in self.entities if entity["type"] == fields.get("type")]
+            offset = fields.get("offset", 0)
+            return DummyResponse(status=200, data=json.dumps(selected[offset:offset + fields["limit"]]),
+                                 headers={"fiware-total-count": len(selected)})
+        if url.endswith("/v2/op/update"):
+            self.entities.extend(body["entities"])
+            return DummyResponse(status=204, data='')
+        return DummyResponse(status=404, data='')
+
+
+class TestDumpRestore(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.entities = [{"id": "{0}{1}".format(entity_type, i), "type": entity_type,
+                          "value": {"value": i, "type": "Integer"}}
+                         for entity_type in ("Room", "Car/Model") for i in range(25)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch("sys.stderr", io.StringIO())
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_dump_restore(self):
+        OrionConnector._request.side_effect = Store(list(self.entities)).request
+        main(["dump", self.url, self.directory.name, "--page-size", "10", "--part-size", "20"])
+        parts = sorted(name for name in os.listdir(self.directory.name) if name.endswith(".ndjson.gz"))
+        self.assertEqual(parts, ["Car%2FModel.000000000000.ndjson.gz", "Car%2FModel.000000000020.ndjson.gz",
+                                 "Room.000000000000.ndjson.gz", "Room.000000000020.ndjson.gz"])
+
+        target = Store([])
+        OrionConnector._request.side_effect = target.request
+        main(["restore", self.url, self.directory.name, "--chunk-size", "7"])
+        self.assertEqual(sorted(target.entities, key=lambda e: e["id"]),
+                         sorted(self.entities, key=lambda e: e["id"]))
+
+        # Completed restores are not repeated
+        OrionConnector._request.reset_mock()
+        main(["restore", self.url, self.directory.name])
+        OrionConnector._request.assert_not_called()
+
+    @patch("sys.stderr", io.StringIO())
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_dump_resume(self):
+        with open(os.path.join(self.directory.name, "dump.checkpoint.json"), "w") as checkpoint:
+            json.dump({"Room": {"offset": 20, "done": False}, "Car/Model": {"offset": 25, "done": True}}, checkpoint)
+        OrionConnector._request.side_effect = Store(list(self.entities)).request
+        main(["dump", self.url, self.directory.name, "--page-size", "10"])
+        parts = sorted(name for name in os.listdir(self.directory.name) if name.endswith(".ndjson.gz"))
+        self.assertEqual(parts, ["Room.000000000020.ndjson.gz"])
+
+
+    @patch("sys.stderr", io.StringIO())
+    def test_dump_restore_service_paths(self):
+        source, target = FakeOrion(), FakeOrion()
+        try:
+            for path in ("/", "/a", "/a/b"):
+                source.connector(service_path=path).create("Room{0}".format(len(path)), "Room", path=path)
+            source_url = source.serve()
+            main(["dump", source_url, self.directory.name, "--service-path", "/,/a,/a/b"])
+            self.assertEqual(sorted(os.listdir(self.directory.name)), ["%2F", "%2Fa", "%2Fa%2Fb"])
+            main(["restore", target.serve(), self.directory.name])
+            for path in ("/", "/a", "/a/b"):
+                self.assertEqual(target.connector(service_path=path).search(key_values=True),
+                                 [{"id": "Room{0}".format(len(path)), "type": "Room", "path": path}])
+            with patch("sys.stderr", io.StringIO()), self.assertRaises(SystemExit):
+                main(["dump", source_url, self.directory.name, "--service-path", "/a/#"])
+            # Without --service-path only / is dumped, not the whole tree
+            root = os.path.join(self.directory.name, "root")
+            main(["dump", source_url, root])
+            self.assertEqual(sorted(os.listdir(root)), ["Room.000000000000.ndjson.gz", "dump.checkpoint.json"])
+            self.assertEqual([entity["path"]["value"] for entity in
+                              read_part(os.path.join(root, "Room.000000000000.ndjson.gz"))], ["/"])
+        finally:
+            source.shutdown()
+            target.shutdown()
+
+
+class TestLoad(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch("sys.stderr", io.StringIO())
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_load_csv(self):
+        path = os.path.join(self.directory.name, "sensors.csv")
+        with open(path, "w") as csv_file:
+            csv_file.write("id,temperature,name,active,floor\n")
+            for i in range(150):
+                csv_file.write("S{0},{1}.5,sensor {0},true,{2}\n".format(i, i, "" if i % 2 else i))
+        target = Store([])
+        OrionConnector._request.side_effect = target.request
+
+        main(["load", self.url, path, "--entity-type", "Sensor", "--chunk-size", "50"])
+        self.assertEqual(len(target.entities), 150)
+        self.assertEqual(OrionConnector._request.call_count, 3)
+        entities = {entity["id"]: entity for entity in target.entities}
+        self.assertEqual(entities["S2"], {
+            "id": "S2", "type": "Sensor",
+            "temperature": {"value": 2.5, "type": "Float"},
+            "name": {"value": "sensor 2", "type": "String"},
+            "active": {"value": True, "type": "Bool"},
+            "floor": {"value": 2, "type": "Integer"}})
+        self.assertNotIn("floor", entities["S3"])
+
+    def test_read_csv_raw_columns(self):
+        path = os.path.join(self.directory.name, "sensors.csv")
+        with open(path, "w") as csv_file:
+            csv_file.write("id,type,temperature\n1e3,true,NaN\n007,Sensor,Infinity\n")
+        self.assertEqual(list(read_rows(path)), [
+            {"id": "1e3", "type": "true", "temperature": "NaN"},
+            {"id": "007", "type": "Sensor", "temperature": "Infinity"}])
+
+    @patch("sys.stderr", io.StringIO())
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_load_ndjson(self):
+        path = os.path.join(self.directory.name, "rooms.ndjson")
+        with open(path, "w") as ndjson_file:
+            ndjson_file.write('{"id": "R1", "type": "Room", "temperature": {"value": 20, "type": "Number"}}\n')
+            ndjson_file.write('{"id": "R2", "type": "Room", "size": {"width": 3}}\n')
+        target = Store([])
+        OrionConnector._request.side_effect = target.request
+
+        main(["load", self.url, path])
+        self.assertEqual(target.entities, [
+            {"id": "R1", "type": "Room", "temperature": {"value": 20, "type": "Number"}},
+            {"id": "R2", "type": "Room", "size": {"value": {"width": 3}, "type": "StructuredValue"}}])
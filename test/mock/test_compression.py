@@ -0,0 +1,72 @@
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import TestCase
+
+from pyfiware import OrionConnector
+
+ENTITIES = [{"id": "Room{0}".format(i), "type": "Room", "temperature": {"value": 20, "type": "Number"}}
+            for i in range(500)]
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """ Serves the entities compressed when asked and records the request bodies"""
+    received = []
+
+    def do_GET(self):
+        data = json.dumps(ENTITIES).encode("utf-8")
+        self.send_response(200)
+        self.send_header("fiware-total-count", str(len(ENTITIES)))
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        self.received.append((self.path, json.loads(data)))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCompression(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), GzipHandler)
+        cls.url = "http://127.0.0.1:{0}".format(cls.server.server_port)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_compressed_response(self):
+        fiware_manager = OrionConnector(self.url, compression=True)
+        self.assertEqual(fiware_manager.search(entity_type="Room", limit=500), ENTITIES)
+        stats = fiware_manager.compression_stats
+        self.assertEqual(stats["received_decoded"], len(json.dumps(ENTITIES)))
+        self.assertLess(stats["received_bytes"], stats["received_decoded"] / 10)
+        self.assertEqual(fiware_manager.bytes_saved, stats["received_decoded"] - stats["received_bytes"])
+
+    def test_uncompressed_by_default(self):
+        fiware_manager = OrionConnector(self.url)
+        self.assertEqual(fiware_manager.search(entity_type="Room", limit=500), ENTITIES)
+        self.assertEqual(fiware_manager.bytes_saved, 0)
+
+    def test_compressed_request_through_proxy(self):
+        GzipHandler.received.clear()
+        fiware_manager = OrionConnector("http://orion.invalid:1026", compression_proxy=self.url,
+                                        compression_threshold=1000)
+        fiware_manager.batch_update("append", ENTITIES)
+        self.assertEqual(GzipHandler.received, [("/v2/op/update", {"actionType": "append", "entities": ENTITIES})])
+        self.assertGreater(fiware_manager.bytes_saved, 0)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from pyfiware.concurrency import AdaptiveLimiter
+
+
+class TestAdaptiveLimiter(TestCase):
+
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(initial=4, maximum=6)
+        for _ in range(5):
+            limiter.success(0.1)
+        self.assertEqual(limiter.limit, 5)
+        for _ in range(100):
+            limiter.success(0.1)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial=8)
+        limiter.failure()
+        self.assertEqual(limiter.limit, 4)
+        limiter.failure()
+        limiter.failure()
+        limiter.failure()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_latency_decrease_once_per_interval(self):
+        limiter = AdaptiveLimiter(initial=8)
+        limiter.success(0.1)
+        limiter.success(1)
+        limiter.success(1)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_baseline_per_key(self):
+        limiter = AdaptiveLimiter(initial=4)
+        for _ in range(4):
+            limiter.success(0.001, key="count")
+        for _ in range(30):
+            limiter.success(0.02, key="batch")
+        self.assertGreater(limiter.limit, 4)
+
+    def test_baseline_decay(self):
+        limiter = AdaptiveLimiter(initial=4)
+        limiter.success(0.001)
+        for _ in range(100):
+            limiter.success(0.02)
+        self.assertGreater(limiter.baseline(), 0.01)
+        limit = limiter.limit
+        for _ in range(10):
+            limiter.success(0.02)
+        self.assertGreater(limiter.limit, limit)
@@ -0,0 +1,84 @@
+# pylint: disable=no-member
+
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+from unittest.mock import Mock, patch
+
+from pyfiware import OrionConnector
+from test.mock.test_fiware_entities import DummyResponse
+
+try:
+    import pyarrow.parquet
+    from pyfiware.export import export_search, infer_columns, write_parquet
+except ImportError:
+    pyarrow = None
+
+
+def entities_response(entities):
+    """ Build a request side effect that serves the entities according to limit and offset"""
+    def request(method, url, fields=None, **kwargs):
+        offset = fields.get("offset", 0)
+        page = entities[offset:offset + fields["limit"]]
+        return DummyResponse(status=200, data=json.dumps(page), headers={"fiware-total-count": len(entities)})
+    return request
+
+
+@skipUnless(pyarrow, "pyarrow not installed")
+class TestExport(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.fiware_manager = OrionConnector(self.url)
+        self.entities = [{
+            "id": "Room{0}".format(i), "type": "Room",
+            "temperature": {"value": i + 0.5, "type": "Number"},
+            "floor": {"value": i % 3, "type": "Integer"},
+            "open": {"value": i % 2 == 0, "type": "Boolean"},
+            "modified": {"value": "2020-01-01T00:00:00.000Z", "type": "DateTime"},
+            "location": {"value": {"x": i}, "type": "StructuredValue"},
+        } for i in range(25)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_infer_columns(self):
+        self.assertEqual(infer_columns(self.entities[:1]), {
+            "id": "string", "type": "string", "temperature": "float", "floor": "int", "open": "bool",
+            "modified": "timestamp", "location": "json"})
+
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_export_search(self):
+        OrionConnector._request.side_effect = entities_response(self.entities)
+        path = os.path.join(self.directory.name, "rooms.parquet")
+
+        rows = export_search(self.fiware_manager, path, page_size=10, row_group_size=20, entity_type="Room")
+        self.assertEqual(rows, 25)
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+        table = parquet.read()
+        self.assertEqual(table.column("id").to_pylist(), [entity["id"] for entity in self.entities])
+        self.assertEqual(table.column("temperature").to_pylist()[3], 3.5)
+        self.assertEqual(json.loads(table.column("location").to_pylist()[4]), {"x": 4})
+
+    def test_widened_columns(self):
+        path = os.path.join(self.directory.name, "series.parquet")
+        pages = [
+            [{"t": 20, "floor": {"value": 1, "type": "Integer"}, "note": None}],
+            [{"t": 20.5, "floor": {"value": 2.5, "type": "Integer"}, "note": None}],
+            [{"t": 21, "note": "open", "code": 7}],
+            [{"t": 22, "code": "A7", "extra": {"a": 1}}],
+        ]
+        self.assertEqual(write_parquet(pages, path, row_group_size=1), 4)
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet.metadata.num_row_groups, 4)
+        table = parquet.read().to_pydict()
+        self.assertEqual(table["t"], [20.0, 20.5, 21.0, 22.0])
+        self.assertEqual(table["floor"], [1.0, 2.5, None, None])
+        self.assertEqual(table["note"], [None, None, "open", None])
+        self.assertEqual([json.loads(code) if code else None for code in table["code"]], [None, None, 7, "A7"])
+        self.assertEqual(table["extra"], [None, None, None, '{"a": 1}'])
+        # The part files of each schema are merged into the file
+        self.assertEqual(os.listdir(self.directory.name), ["series.parquet"])
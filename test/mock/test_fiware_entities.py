@@ -1,9 +1,11 @@
 # pylint: disable=no-member
 
+import json
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
 from pyfiware import OrionConnector, FiException
+from pyfiware.dedup import WriteDedup
 
 
 class DummyResponse:
@@ -212,6 +214,28 @@ class TestFiwareManagerCreations(TestCase):
             }
         )
 
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(
+        status=204,
+        data=''
+    )))
+    def test_create_upsert(self):
+        self.fiware_manager.create(element_id="1", element_type="fake", upsert=True, weight=300)
+        self.fiware_manager._request.assert_called_once_with(
+            method='POST',
+            url=self.url + '/v2/entities?options=upsert',
+            headers={
+                'Accept': 'application/json',
+                'Content-Type': 'application/json',
+            },
+            body={
+                'id': '1',
+                'type': 'fake',
+                'weight': {'value': 300,
+                           'type': 'Integer'
+                           }
+            }
+        )
+
     @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(
         status=403,
         data=''
@@ -385,3 +409,231 @@ class TestFiwareManagerPatch(TestCase):
 #                 'Accept': 'application/json',
 #             },
 #         )
+
+
+class TestFiwareManagerBatch(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.fiware_manager = OrionConnector(self.url)
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(
+        status=204,
+        data=''
+    )))
+    def test_batch_update_many(self):
+        entities = ({"id": str(i), "type": "fake"} for i in range(250))
+        progress = Mock()
+        count = self.fiware_manager.batch_update_many("append", entities, chunk_size=100, progress=progress)
+        self.assertEqual(count, 250)
+        self.assertEqual(self.fiware_manager._request.call_count, 3)
+        progress.assert_called_with(250)
+        sent = sorted(len(call[1]["body"]["entities"]) for call in self.fiware_manager._request.call_args_list)
+        self.assertEqual(sent, [50, 100, 100])
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(
+        status=500,
+        data='{"error":"Everything Blew up"}'
+    )))
+    def test_batch_update_many_raises(self):
+        limit = self.fiware_manager.concurrency_limit
+        with self.assertRaises(FiException):
+            self.fiware_manager.batch_update_many("append", [{"id": "1", "type": "fake"}])
+        self.assertEqual(self.fiware_manager.concurrency_limit, limit // 2)
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(
+        status=204,
+        data=''
+    )))
+    def test_batch_update_many_fixed_workers(self):
+        self.fiware_manager.limiter = Mock()
+        count = self.fiware_manager.batch_update_many("append", [{"id": "1", "type": "fake"}], max_workers=2)
+        self.assertEqual(count, 1)
+        self.fiware_manager.limiter.success.assert_not_called()
+
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_delete_where(self):
+        entities = [{"id": str(i), "type": "fake"} for i in range(2500)]
+
+        def request(method, url, fields=None, body=None, **kwargs):
+            if method == "GET":
+                return DummyResponse(status=200, data=json.dumps(entities[:fields["limit"]]),
+                                     headers={"fiware-total-count": len(entities)})
+            for entity in body["entities"]:
+                entities.remove(entity)
+            return DummyResponse(status=204, data='')
+        self.fiware_manager._request.side_effect = request
+
+        deleted = self.fiware_manager.delete_where(entity_type="fake", query="temperature>40")
+        self.assertEqual(deleted, 2500)
+        self.assertEqual(entities, [])
+        get_calls = [call for call in self.fiware_manager._request.call_args_list if call[1]["method"] == "GET"]
+        self.assertEqual(len(get_calls), 4)
+        self.assertEqual(get_calls[0][1]["fields"], {
+            "options": "count,keyValues", "limit": 1000, "type": "fake", "q": "temperature>40", "attrs": "id"})
+
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_delete_where_no_progress(self):
+        self.fiware_manager._request.side_effect = lambda method, **kwargs: DummyResponse(
+            status=200, data='[{"id": "1", "type": "fake"}]', headers={"fiware-total-count": 1}) \
+            if method == "GET" else DummyResponse(status=204, data='')
+
+        with self.assertRaises(FiException):
+            self.fiware_manager.delete_where(entity_type="fake")
+
+    @patch.object(OrionConnector, "_request", Mock())
+    def test_update_where(self):
+        entities = [{"id": str(i), "type": "fake"} for i in range(1500)]
+        updated = []
+
+        def request(method, url, fields=None, body=None, **kwargs):
+            if method == "GET":
+                offset = fields.get("offset", 0)
+                return DummyResponse(status=200, data=json.dumps(entities[offset:offset + fields["limit"]]),
+                                     headers={"fiware-total-count": len(entities)})
+            self.assertEqual(body["actionType"], "append")
+            updated.extend(body["entities"])
+            return DummyResponse(status=204, data='')
+        self.fiware_manager._request.side_effect = request
+
+        attributes = {"status": {"value": "maintenance", "type": "Text"}}
+        count = self.fiware_manager.update_where({"entity_type": "fake"}, attributes, action="append")
+        self.assertEqual(count, 1500)
+        self.assertEqual(sorted(updated, key=lambda entity: int(entity["id"])),
+                         [{"id": str(i), "type": "fake", **attributes} for i in range(1500)])
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(
+        status=200,
+        data='[]',
+        headers={"fiware-total-count": 42}
+    )))
+    def test_update_where_dry_run(self):
+        count = self.fiware_manager.update_where({"entity_type": "fake"}, {}, dry_run=True)
+        self.assertEqual(count, 42)
+        self.fiware_manager._request.assert_called_once()
+
+    @patch.object(OrionConnector, "_transport", Mock(maxsize=16))
+    def test_multi_tenant(self):
+        def request(method, url, headers=None, **kwargs):
+            return DummyResponse(status=200, data='[]', headers={"fiware-total-count": len(headers["Fiware-Service"])})
+        OrionConnector._transport.request = Mock(side_effect=request)
+        self.fiware_manager.service = "default"
+
+        result = self.fiware_manager.multi_tenant(["a", "bb", "ccc"], "count", entity_type="fake")
+        self.assertEqual(result, {"a": 1, "bb": 2, "ccc": 3})
+        self.assertEqual(self.fiware_manager.service, "default")
+
+    def test_multi_tenant_invalid_operation(self):
+        with self.assertRaises(FiException):
+            self.fiware_manager.multi_tenant(["a"], "delete")
+
+
+class TestFiwareManagerScoped(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.fiware_manager = OrionConnector(self.url, service="default", service_path="/base")
+
+    @patch.object(OrionConnector, "_transport", Mock())
+    def test_scoped_headers(self):
+        OrionConnector._transport.request = Mock(return_value=DummyResponse(
+            status=200, data='{"id":"CorrectID","type":"fake"}'))
+
+        view = self.fiware_manager.scoped(service="tenant", service_path="/tenant/path/")
+        view.get("CorrectID")
+        headers = OrionConnector._transport.request.call_args[1]["headers"]
+        self.assertEqual(headers["Fiware-Service"], "tenant")
+        self.assertEqual(headers["Fiware-ServicePath"], "/tenant/path")
+        self.assertEqual(view.url_entities, self.fiware_manager.url_entities)
+
+        self.fiware_manager.get("CorrectID")
+        headers = OrionConnector._transport.request.call_args[1]["headers"]
+        self.assertEqual(headers["Fiware-Service"], "default")
+        self.assertEqual(headers["Fiware-ServicePath"], "/base")
+
+    def test_scoped_immutable(self):
+        view = self.fiware_manager.scoped(service="tenant")
+        self.assertEqual(view.service_path, "/base")
+        with self.assertRaises(AttributeError):
+            view.service = "other"
+        with self.assertRaises(AttributeError):
+            view.service_path = "/other"
+        self.assertEqual(view.scoped(service_path="/other").service_path, "/other")
+        self.assertEqual(view.scoped(service_path="/other").service, "tenant")
+
+
+class TestFiwareManagerDedup(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.fiware_manager = OrionConnector(self.url, dedup=WriteDedup(tolerances={"temperature": 0.1}))
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(status=204, data="")))
+    def test_patch_unchanged(self):
+        self.fiware_manager.patch("Room1", "Room", temperature=20.0, pressure=720)
+        self.fiware_manager.patch("Room1", "Room", temperature=20.05, pressure=720)
+        self.fiware_manager.patch("Room1", "Room", temperature=20.05, pressure=721)
+        self.assertEqual(OrionConnector._request.call_count, 2)
+        self.assertEqual(OrionConnector._request.call_args[1]["body"], {"pressure": 721})
+        self.assertEqual(self.fiware_manager.dedup.skipped_requests, 1)
+        self.assertEqual(self.fiware_manager.dedup.dropped_attributes, 3)
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(status=204, data="")))
+    def test_batch_update_unchanged(self):
+        entities = [{"id": "Room{0}".format(i), "type": "Room", "pressure": {"value": 720, "type": "Number"}}
+                    for i in range(3)]
+        self.fiware_manager.batch_update("append", entities)
+        entities[1]["pressure"] = {"value": 721, "type": "Number"}
+        self.fiware_manager.batch_update("append", entities)
+        self.assertEqual(OrionConnector._request.call_args[1]["body"]["entities"], [entities[1]])
+
+        self.fiware_manager.batch_update("append", entities)
+        self.assertEqual(OrionConnector._request.call_count, 2)
+
+        self.fiware_manager.delete("Room0")
+        self.fiware_manager.batch_update("append", entities)
+        self.assertEqual(OrionConnector._request.call_args[1]["body"]["entities"], [entities[0]])
+
+
+class TestFiwareManagerSync(TestCase):
+    url = "http://127.0.0.1:1026"
+
+    def setUp(self):
+        self.fiware_manager = OrionConnector(self.url)
+        self.current = [
+            {"id": "Room1", "type": "Room", "temperature": {"value": 20, "type": "Number", "metadata": {}},
+             "pressure": {"value": 720, "type": "Number", "metadata": {}}},
+            {"id": "Room2", "type": "Room", "temperature": {"value": 21, "type": "Number", "metadata": {}}},
+        ]
+        self.sent = []
+
+        def request(method, url, body=None, headers=None):
+            if url.startswith(self.fiware_manager.url_batch_query):
+                ids = [entity["id"] for entity in body["entities"]]
+                return DummyResponse(status=200, data=json.dumps(
+                    [entity for entity in self.current if entity["id"] in ids]))
+            self.sent.append(body)
+            return DummyResponse(status=204, data="")
+        self.request = request
+
+    def test_sync_entities(self):
+        desired = [
+            {"id": "Room1", "type": "Room", "temperature": {"value": 22, "type": "Number"}},
+            {"id": "Room2", "type": "Room", "temperature": {"value": 21, "type": "Number"}},
+            {"id": "Room3", "type": "Room", "temperature": {"value": 19, "type": "Number"}},
+        ]
+        with patch.object(OrionConnector, "_request", Mock(side_effect=self.request)):
+            stats = self.fiware_manager.sync_entities(desired, max_workers=1)
+        self.assertEqual(stats, {"entities": 3, "created": 1, "updated": 1, "unchanged": 1, "attributes_set": 2,
+                                 "attributes_removed": 1})
+        self.assertEqual(self.sent, [
+            {"actionType": "append", "entities": [desired[0], desired[2]]},
+            {"actionType": "delete", "entities": [{"id": "Room1", "type": "Room", "pressure": {}}]},
+        ])
+
+    def test_sync_entity_unchanged(self):
+        with patch.object(OrionConnector, "_request", Mock(side_effect=self.request)):
+            stats = self.fiware_manager.sync_entity(
+                {"id": "Room1", "type": "Room", "temperature": {"value": 20, "type": "Number"}}, remove=False)
+        self.assertEqual(stats["unchanged"], 1)
+        self.assertEqual(self.sent, [])
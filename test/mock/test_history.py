@@ -0,0 +1,215 @@
+# pylint: disable=no-member
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+from unittest.mock import Mock, patch
+
+from pyfiware.cache import HistoryCache
+from pyfiware.history import AsyncHistoryConnector, HistoryConnector
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from test.mock.test_fiware_entities import DummyResponse
+
+
+def paged_response(records):
+    """ Build a request side effect that serves the records according to limit and offset"""
+    def request(method, url, fields=None, **kwargs):
+        page = records[fields["offset"]:fields["offset"] + fields["limit"]]
+        return DummyResponse(status=200, data=json.dumps(page))
+    return request
+
+
+def timed_response(records):
+    """ Build a request side effect that serves the records filtered by time, limit and offset"""
+    def request(method, url, fields=None, **kwargs):
+        selected = [record for record in records
+                    if fields.get("time>", "") < record["time"] and record["time"] < fields.get("time<", "9")]
+        page = selected[fields["offset"]:fields["offset"] + fields["limit"]]
+        return DummyResponse(status=200, data=json.dumps(page))
+    return request
+
+
+class TestHistoryPagination(TestCase):
+    url = "http://127.0.0.1:8080"
+
+    def setUp(self):
+        self.history = HistoryConnector(self.url, token="TOKEN")
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_entity_get_iter(self):
+        records = [{"time": str(i)} for i in range(25)]
+        HistoryConnector._transport.request = Mock(side_effect=paged_response(records))
+
+        result = list(self.history.entity_get_iter("S1", "Room", "Room1", page_size=10))
+        self.assertEqual(result, records)
+        self.assertEqual(HistoryConnector._transport.request.call_count, 3)
+        self.assertEqual(HistoryConnector._transport.request.call_args[1]["fields"]["offset"], 20)
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_entities_get_iter_exact_pages(self):
+        records = [{"time": str(i)} for i in range(20)]
+        HistoryConnector._transport.request = Mock(side_effect=paged_response(records))
+
+        result = list(self.history.entities_get_iter("S1", "Room", page_size=10))
+        self.assertEqual(result, records)
+        self.assertEqual(HistoryConnector._transport.request.call_count, 3)
+
+
+class TestHistoryRange(TestCase):
+    url = "http://127.0.0.1:8080"
+
+    def setUp(self):
+        self.history = HistoryConnector(self.url, token="TOKEN")
+        start = datetime(2020, 1, 1)
+        self.records = [{"time": (start + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'), "value": i}
+                        for i in range(1, 24 * 60)]
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_fetch_range(self):
+        HistoryConnector._transport.request = Mock(side_effect=timed_response(self.records))
+
+        result = self.history.fetch_range("S1", "Room", "Room1", datetime(2020, 1, 1), datetime(2020, 1, 2),
+                                          window=timedelta(hours=1), target_size=200)
+        self.assertEqual(result, self.records)
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_fetch_range_split_full_windows(self):
+        HistoryConnector._transport.request = Mock(side_effect=timed_response(self.records))
+
+        result = self.history.fetch_range("S1", "Room", None, datetime(2020, 1, 1), datetime(2020, 1, 2),
+                                          window=timedelta(days=1), limit=100)
+        self.assertEqual(result, self.records)
+        for call in HistoryConnector._transport.request.call_args_list:
+            self.assertTrue(call[1]["url"].endswith("/scenario/S1/entities/Room"))
+
+
+class TestHistoryCache(TestCase):
+    url = "http://127.0.0.1:8080"
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.cache = HistoryCache(os.path.join(self.directory.name, "cache.db"))
+        self.history = HistoryConnector(self.url, token="TOKEN", cache=self.cache)
+        start = datetime(2020, 1, 1)
+        self.records = [{"time": (start + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'), "value": i}
+                        for i in range(24 * 60)]
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_cached_range(self):
+        HistoryConnector._transport.request = Mock(side_effect=timed_response(self.records))
+
+        first = self.history.fetch_range("S1", "Room", "Room1", datetime(2020, 1, 1, 2), datetime(2020, 1, 1, 4))
+        self.assertEqual(first, self.records[121:240])
+        HistoryConnector._transport.request.reset_mock()
+
+        second = self.history.fetch_range("S1", "Room", "Room1", datetime(2020, 1, 1, 2), datetime(2020, 1, 1, 4))
+        self.assertEqual(second, first)
+        HistoryConnector._transport.request.assert_not_called()
+
+        wider = self.history.fetch_range("S1", "Room", "Room1", datetime(2020, 1, 1, 1), datetime(2020, 1, 1, 5))
+        self.assertEqual(wider, self.records[61:300])
+        for call in HistoryConnector._transport.request.call_args_list:
+            fields = call[1]["fields"]
+            self.assertTrue(fields["time<"] <= "2020-01-01T02:00:00.000001Z" or
+                            fields["time>"] >= "2020-01-01T03:59:59.999999Z")
+
+    def test_recent_range_revalidated(self):
+        now = datetime.utcnow()
+        key = self.cache.key("S1", "Room", "Room1")
+        self.cache.store(key, now - timedelta(hours=1), now, [])
+        self.assertAlmostEqual(self.cache.missing(key, now - timedelta(hours=1), now)[0][0].replace(tzinfo=None),
+                               now - timedelta(seconds=self.cache.revalidate), delta=timedelta(seconds=1))
+
+    def test_eviction(self):
+        self.cache.max_bytes = 1000
+        first = self.cache.key("S1", "Room", "Room1")
+        second = self.cache.key("S1", "Room", "Room2")
+        self.cache.store(first, datetime(2020, 1, 1), datetime(2020, 1, 2), self.records[:20])
+        self.cache.store(second, datetime(2020, 1, 1), datetime(2020, 1, 2), self.records[:20])
+        self.assertEqual(self.cache.get(first, datetime(2020, 1, 1), datetime(2020, 1, 2)), [])
+        self.assertEqual(len(self.cache.get(second, datetime(2020, 1, 1), datetime(2020, 1, 2))), 20)
+
+
+@skipUnless(numpy, "numpy not installed")
+class TestHistoryAggregate(TestCase):
+    url = "http://127.0.0.1:8080"
+
+    def setUp(self):
+        self.history = HistoryConnector(self.url, token="TOKEN")
+        start = datetime(2020, 1, 1)
+        self.records = [{"time": (start + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                         "temperature": {"value": i, "type": "Number"}} for i in range(1, 120)]
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_aggregate(self):
+        HistoryConnector._transport.request = Mock(side_effect=timed_response(self.records))
+
+        result = self.history.aggregate("S1", "Room", "Room1", datetime(2020, 1, 1), datetime(2020, 1, 1, 2),
+                                        ["temperature"], freq="1h", funcs=["count", "mean", "min", "max"])
+        self.assertEqual(list(result["time"]), [numpy.datetime64("2020-01-01T00:00"),
+                                                numpy.datetime64("2020-01-01T01:00")])
+        self.assertEqual(list(result["temperature"]["count"]), [59, 60])
+        self.assertEqual(list(result["temperature"]["mean"]), [30, 89.5])
+        self.assertEqual(list(result["temperature"]["min"]), [1, 60])
+        self.assertEqual(list(result["temperature"]["max"]), [59, 119])
+
+    def test_aggregate_unknown_function(self):
+        with self.assertRaises(ValueError):
+            self.history.aggregate("S1", "Room", "Room1", datetime(2020, 1, 1), datetime(2020, 1, 1, 2),
+                                   ["temperature"], funcs=["median"])
+
+
+class TestHistoryBulkCreate(TestCase):
+    url = "http://127.0.0.1:8080"
+
+    def setUp(self):
+        self.history = HistoryConnector(self.url, token="TOKEN")
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_entity_create_many(self):
+        HistoryConnector._transport.request = Mock(return_value=DummyResponse(status=201, data=''))
+
+        stats = self.history.entity_create_many("S1", ({"id": str(i), "value": i} for i in range(50)),
+                                                max_in_flight=4)
+        self.assertEqual(stats["created"], 50)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(HistoryConnector._transport.request.call_count, 50)
+
+    @patch.object(HistoryConnector, "_transport", Mock())
+    def test_entity_create_many_retries(self):
+        HistoryConnector._transport.request = Mock(side_effect=[
+            DummyResponse(status=503, data=''), DummyResponse(status=201, data=''),
+            DummyResponse(status=400, data='')])
+
+        stats = self.history.entity_create_many("S1", [{"id": "1"}, {"id": "2"}], max_in_flight=1, retry_delay=0)
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(HistoryConnector._transport.request.call_count, 3)
+
+
+class TestAsyncHistory(TestCase):
+    url = "http://127.0.0.1:8080"
+
+    @patch.object(HistoryConnector, "_transport", Mock(maxsize=4))
+    def test_entity_get_gather(self):
+        HistoryConnector._transport.request = Mock(return_value=DummyResponse(status=200, data='[{"time": "1"}]'))
+        history = AsyncHistoryConnector(self.url, token="TOKEN")
+
+        async def fan_out():
+            return await asyncio.gather(*(history.entity_get("S1", "Room", "Room{0}".format(i)) for i in range(50)))
+
+        results = asyncio.run(fan_out())
+        self.assertEqual(results, [[{"time": "1"}]] * 50)
+        self.assertEqual(HistoryConnector._transport.request.call_count, 50)
+        self.assertEqual(history._executor._max_workers, 4)
@@ -0,0 +1,45 @@
+import json
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+from pyfiware.cli import main
+from pyfiware.loadgen import LoadGenerator, format_report, parse_mix, percentile
+from pyfiware.testing import FakeOrion
+
+
+class TestLoadGenerator(TestCase):
+
+    def test_run(self):
+        fake = FakeOrion()
+        generator = LoadGenerator(fake.connector(), entities=100, tenants=2, rate=400, batch_size=10, seed=1)
+        generator.setup()
+        self.assertEqual(fake.connector(service="loadgen1").count(entity_type="Device"), 100)
+        report = generator.run(0.25)
+        self.assertEqual(report["requests"], 100)
+        self.assertEqual(sum(stats["count"] for stats in report["operations"].values()), 100)
+        self.assertEqual(report["errors"], 0)
+        self.assertIn("patch", format_report(report))
+
+    def test_errors(self):
+        fake = FakeOrion()
+        # Without setup the devices do not exist and the patches fail
+        report = LoadGenerator(fake.connector(), entities=10, mix={"patch": 1}, rate=200, seed=1).run(0.1)
+        self.assertEqual(report["operations"]["patch"]["error_types"], {"404": report["requests"]})
+        self.assertEqual(report["error_rate"], 1)
+
+    def test_parse(self):
+        self.assertEqual(parse_mix("patch=3,get"), {"patch": 3, "get": 1})
+        with self.assertRaises(ValueError):
+            parse_mix("post=1")
+        self.assertEqual(percentile(list(range(1, 101)), 0.99), 99)
+        with self.assertRaises(ValueError):
+            LoadGenerator(FakeOrion().connector(), rate=0)
+
+    def test_cli(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            main(["loadgen", "fake", "--entities", "20", "--rate", "200", "--duration", "0.1", "--json"])
+        self.assertEqual(json.loads(output.getvalue())["requests"], 20)
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            main(["loadgen", "fake", "--rate", "0"])
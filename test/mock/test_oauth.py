@@ -0,0 +1,112 @@
+# pylint: disable=no-member
+
+import json
+import os
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep, time
+from unittest import TestCase
+from unittest.mock import Mock
+
+from pyfiware.oauth import OAuthManager, FileTokenStore
+from test.mock.test_fiware_entities import DummyResponse
+
+
+def token_response(token="TOKEN", expires_in=3600):
+    return DummyResponse(status=200, data=json.dumps({
+        "token_type": "Bearer",
+        "access_token": token,
+        "refresh_token": "REFRESH",
+        "expires_in": expires_in,
+    }))
+
+
+class TestOAuthTokenStore(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.store = FileTokenStore(os.path.join(self.directory.name, "tokens.json"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _manager(self):
+        manager = OAuthManager(oauth_server_url="http://keyrock", client_id="client", client_secret="secret",
+                               user="user", password="password", token_store=self.store)
+        manager.PM = Mock()
+        manager.PM.request = Mock(return_value=token_response())
+        return manager
+
+    def test_token_shared(self):
+        first = self._manager()
+        second = self._manager()
+        self.assertEqual(first.token, "Bearer TOKEN")
+        self.assertEqual(second.token, "Bearer TOKEN")
+        first.PM.request.assert_called_once()
+        second.PM.request.assert_not_called()
+
+    def test_store_private(self):
+        self.assertEqual(self._manager().token, "Bearer TOKEN")
+        self.assertEqual(os.stat(self.store.path).st_mode & 0o777, 0o600)
+        self.assertEqual(os.stat(self.store.lock_path).st_mode & 0o777, 0o600)
+
+    def test_expired_token_refreshed_once(self):
+        self.store.save("http://keyrock|client|user", {
+            "token_type": "Bearer", "access_token": "OLD", "refresh_token": "OLD_REFRESH", "expiration": time()})
+        first = self._manager()
+        first.PM.request = Mock(return_value=token_response("NEW"))
+        second = self._manager()
+        self.assertEqual(first.token, "Bearer NEW")
+        self.assertEqual(second.token, "Bearer NEW")
+        first.PM.request.assert_called_once()
+        self.assertIn("refresh_token=OLD_REFRESH", first.PM.request.call_args[1]["body"])
+        second.PM.request.assert_not_called()
+
+
+class TestOAuthRefresh(TestCase):
+
+    def _manager(self, **kwargs):
+        manager = OAuthManager(oauth_server_url="http://keyrock", client_id="client", client_secret="secret",
+                               user="user", password="password", **kwargs)
+        manager.PM = Mock()
+        return manager
+
+    def test_single_flight(self):
+        manager = self._manager()
+
+        def slow_login(**kwargs):
+            sleep(0.1)
+            return token_response()
+        manager.PM.request = Mock(side_effect=slow_login)
+
+        tokens = []
+        threads = [Thread(target=lambda: tokens.append(manager.token)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tokens, ["Bearer TOKEN"] * 8)
+        manager.PM.request.assert_called_once()
+
+    def test_background_refresh(self):
+        manager = self._manager(secure_lapse=0, refresh_margin=0)
+        manager.PM.request = Mock(side_effect=[token_response("FIRST", expires_in=0.2), token_response("SECOND")])
+        manager.start_refresher()
+        try:
+            sleep(1.3)
+            self.assertEqual(manager.PM.request.call_count, 2)
+            self.assertEqual(manager.token, "Bearer SECOND")
+        finally:
+            manager.stop_refresher()
+
+    def test_background_refresh_retries_transport_errors(self):
+        manager = self._manager(retry_delay=0.1)
+        manager.PM.request = Mock(side_effect=[OSError("Connection refused"), token_response("TOKEN")])
+        manager.start_refresher()
+        try:
+            sleep(0.5)
+            self.assertTrue(manager._refresher.is_alive())
+            self.assertEqual(manager.PM.request.call_count, 2)
+            self.assertEqual(manager.token, "Bearer TOKEN")
+        finally:
+            manager.stop_refresher()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+from time import sleep
+from unittest import TestCase
+
+from pyfiware import OrionConnector
+from pyfiware.profiling import Profiler
+from pyfiware.testing import FakeOrion
+from pyfiware.transport import MemoryTransport
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler()
+        self.fiware_manager = FakeOrion().connector(profiler=self.profiler)
+
+    def test_phases(self):
+        self.fiware_manager.batch_update_many("append", ({"id": "Room{0}".format(i), "type": "Room"}
+                                                         for i in range(250)), chunk_size=100, max_workers=2)
+        self.fiware_manager.search(entity_type="Room", limit=250)
+        report = self.profiler.report()
+        self.assertEqual(report["batch_update"]["calls"], 3)
+        self.assertEqual(report["batch_update_many"]["calls"], 1)
+        self.assertGreater(report["batch_update_many"]["phases"]["wait"], 0)
+        self.assertEqual(report["search"]["calls"], 1)
+        search = report["search"]
+        self.assertGreater(search["phases"]["network"], 0)
+        self.assertGreater(search["phases"]["decode"], 0)
+        self.assertEqual(search["phases"]["serialize"], 0)
+        self.assertAlmostEqual(sum(search["phases"].values()), search["total"], delta=search["total"] * 0.01)
+        self.assertGreater(report["batch_update"]["phases"]["serialize"], 0)
+        self.assertIn("batch_update_many", self.profiler.format_report())
+
+    def test_pool_wait(self):
+        fake = FakeOrion()
+
+        def slow_handler(request):
+            sleep(0.01)
+            return fake.handle(request)
+        fiware_manager = OrionConnector(fake.host, transport=MemoryTransport(slow_handler), profiler=self.profiler)
+        fiware_manager.batch_update_many("append", ({"id": "Room{0}".format(i), "type": "Room"}
+                                                    for i in range(200)), chunk_size=10, max_workers=4)
+        batch_update_many = self.profiler.report()["batch_update_many"]
+        # The chunks run in the pool, the caller waits for them instead of building
+        self.assertGreater(batch_update_many["phases"]["wait"], batch_update_many["total"] * 0.5)
+        self.assertLess(batch_update_many["phases"]["build"], batch_update_many["total"] * 0.5)
+        self.assertAlmostEqual(sum(batch_update_many["phases"].values()), batch_update_many["total"],
+                               delta=batch_update_many["total"] * 0.01)
+
+    def test_nested(self):
+        # search requests the rest of the results in a nested search
+        self.fiware_manager.batch_update("append", [{"id": "Room{0}".format(i), "type": "Room"} for i in range(1500)])
+        self.profiler.reset()
+        self.assertEqual(len(self.fiware_manager.search()), 1500)
+        report = self.profiler.report()
+        self.assertEqual(report["search"]["calls"], 2)
+        self.assertLessEqual(sum(report["search"]["phases"].values()), report["search"]["total"] * 1.01)
+
+    def test_samples(self):
+        profiler = Profiler(sample_rate=1, memory=True)
+        fiware_manager = FakeOrion().connector(profiler=profiler)
+        fiware_manager.create("Room1", "Room", temperature=20)
+        fiware_manager.get("Room1")
+        if not profiler.samples:
+            self.skipTest("Another profiler is active")
+        self.assertEqual(profiler.samples, 2)
+        self.assertIn("cProfile of 2 sampled operations", profiler.format_report())
+        self.assertTrue(profiler.allocations())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "connector.pstats")
+            profiler.dump_stats(path)
+            self.assertTrue(os.path.getsize(path))
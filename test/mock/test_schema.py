@@ -0,0 +1,57 @@
+# pylint: disable=no-member
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from pyfiware import OrionConnector
+from pyfiware.loader import to_entity
+from pyfiware.schema import SchemaRegistry
+from test.mock.test_fiware_entities import DummyResponse
+
+
+class TestSchemaRegistry(TestCase):
+
+    def test_registered(self):
+        schemas = SchemaRegistry()
+        schemas.register("Room", {"temperature": "Float", "pressure": "Integer"})
+        self.assertEqual(schemas.serialize("Room1", "Room", {"temperature": 21, "pressure": 720, "name": "Hall"}), {
+            "id": "Room1", "type": "Room",
+            "temperature": {"value": 21, "type": "Float"},
+            "pressure": {"value": 720, "type": "Integer"},
+            "name": {"value": "Hall", "type": "String"}})
+
+    def test_inferred(self):
+        schemas = SchemaRegistry()
+        rows = [{"id": "Room1", "temperature": 21.5}, {"id": "Room2", "temperature": 20}]
+        entities = list(schemas.serialize_many("Room", rows))
+        self.assertEqual(schemas.get("Room").attributes, {"temperature": "Float"})
+        self.assertEqual(entities[1], {"id": "Room2", "type": "Room", "temperature": {"value": 20, "type": "Float"}})
+
+        schemas.serialize("Room3", "Room", {"temperature": "warm"})
+        self.assertEqual(schemas.serialize("Room4", "Room", {"temperature": "warm"})["temperature"],
+                         {"value": "warm", "type": "String"})
+
+        schemas.get("Sensor", {"count": 20})
+        self.assertEqual(schemas.serialize("Sensor1", "Sensor", {"count": 20.5})["count"],
+                         {"value": 20.5, "type": "Float"})
+        self.assertEqual(schemas.serialize("Sensor2", "Sensor", {"count": 21})["count"],
+                         {"value": 21, "type": "Float"})
+
+        self.assertEqual(SchemaRegistry(infer=False).serialize("Room1", "Room", {"temperature": 20})["temperature"],
+                         {"value": 20, "type": "Integer"})
+
+    def test_loader(self):
+        schemas = SchemaRegistry()
+        schemas.register("Room", {"temperature": "Float"})
+        self.assertEqual(to_entity({"id": 1, "temperature": 20, "name": None}, "Room", schemas=schemas),
+                         {"id": "1", "type": "Room", "temperature": {"value": 20, "type": "Float"}})
+        self.assertEqual(to_entity({"id": 2, "temperature": {"value": 1, "type": "Number"}}, "Room", schemas=schemas),
+                         {"id": "2", "type": "Room", "temperature": {"value": 1, "type": "Number"}})
+
+    @patch.object(OrionConnector, "_request", Mock(return_value=DummyResponse(status=201, data='')))
+    def test_create(self):
+        schemas = SchemaRegistry()
+        schemas.register("Room", {"temperature": "Float"})
+        OrionConnector("http://127.0.0.1:1026", schemas=schemas).create("Room1", "Room", temperature=20)
+        self.assertEqual(OrionConnector._request.call_args[1]["body"],
+                         {"id": "Room1", "type": "Room", "temperature": {"value": 20, "type": "Float"}})
@@ -0,0 +1,139 @@
+from unittest import TestCase
+
+from pyfiware import FiException, OrionConnector
+from pyfiware.dedup import WriteDedup
+from pyfiware.testing import FakeOrion
+
+
+class TestFakeOrion(TestCase):
+
+    def setUp(self):
+        self.fake = FakeOrion()
+        self.fiware_manager = self.fake.connector(service="tenant", service_path="/city")
+
+    def test_entities(self):
+        self.fiware_manager.create("Room1", "Room", temperature=20, name="Hall")
+        with self.assertRaises(FiException) as context:
+            self.fiware_manager.create("Room1", "Room", temperature=20)
+        self.assertEqual(context.exception.status, 422)
+        self.fiware_manager.create("Room1", "Room", upsert=True, temperature=21)
+        with self.assertRaises(FiException):
+            self.fiware_manager.patch("Room1", "Room", pressure={"value": 720, "type": "Integer"})
+        self.assertEqual(self.fiware_manager.get("Room1", key_values=True),
+                         {"id": "Room1", "type": "Room", "temperature": 21, "name": "Hall"})
+        self.fiware_manager.update("Room1", "Room", pressure={"value": 720, "type": "Integer"})
+        self.fiware_manager.delete_attribute("Room1", "Room", "name")
+        self.assertEqual(self.fiware_manager.get("Room1")["pressure"],
+                         {"value": 720, "type": "Integer", "metadata": {}})
+        self.assertNotIn("name", self.fiware_manager.get("Room1"))
+        self.fiware_manager.delete("Room1")
+        self.assertIsNone(self.fiware_manager.get("Room1"))
+
+    def test_search(self):
+        self.fiware_manager.batch_update("append", [
+            {"id": "Room{0}".format(i), "type": "Room", "temperature": {"value": i, "type": "Number"}}
+            for i in range(2500)])
+        self.fiware_manager.create("Sensor1", "Sensor", temperature=5)
+        self.assertEqual(len(self.fiware_manager.search(entity_type="Room")), 2500)
+        self.assertEqual(self.fiware_manager.count(query="temperature<10"), 11)
+        self.assertEqual(self.fiware_manager.count(query="temperature==5,6;temperature!=6"), 2)
+        self.assertEqual(self.fiware_manager.count(query="temperature==10..19", id_pattern="^Room1"), 10)
+        self.assertEqual(self.fiware_manager.types(), ["Room", "Sensor"])
+        self.assertEqual(self.fiware_manager.batch_query([{"id": "Room3", "type": "Room"}, {"id": "Room9"}],
+                                                         attrs=["id"]),
+                         [{"id": "Room3", "type": "Room"}, {"id": "Room9", "type": "Room"}])
+        self.assertEqual(self.fiware_manager.delete_where(entity_type="Room"), 2500)
+        self.assertEqual(self.fiware_manager.count(), 1)
+
+    def test_service_paths(self):
+        self.fiware_manager.create("Room1", "Room")
+        self.fiware_manager.scoped(service_path="/city/north").create("Room2", "Room")
+        self.fiware_manager.scoped(service="other").create("Room3", "Room")
+        self.assertEqual(self.fiware_manager.count(), 1)
+        self.assertEqual(self.fiware_manager.count(hierarchical_search=True), 2)
+        self.assertEqual(self.fake.connector(service="tenant").count(), 2)
+        # Only the exact service path is deleted
+        self.assertEqual(self.fiware_manager.delete_where(entity_type="Room"), 1)
+        self.assertEqual(self.fiware_manager.count(hierarchical_search=True), 1)
+        self.assertEqual(self.fiware_manager.scoped(service="other").count(), 1)
+        # Like Orion, a hierarchical scope finds the entity to delete
+        self.fiware_manager.scoped(service_path="/#").delete("Room2")
+        self.assertEqual(self.fake.connector(service="tenant").count(), 0)
+        with self.assertRaises(FiException) as context:
+            self.fiware_manager.get("Room<1>")
+        self.assertEqual(context.exception.status, 400)
+
+    def test_delete_where_without_service_path(self):
+        fiware_manager = self.fake.connector()
+        fiware_manager.create("Room1", "Room")
+        fiware_manager.scoped(service_path="/a").create("Room2", "Room")
+        # Orion searches every service path without Fiware-ServicePath, but deletes in /
+        self.assertEqual(fiware_manager.delete_where(entity_type="Room"), 1)
+        self.assertEqual(fiware_manager.search(key_values=True), [{"id": "Room2", "type": "Room"}])
+        with self.assertRaises(FiException):
+            fiware_manager.scoped(service_path="/#").delete_where(entity_type="Room")
+
+    def test_update_where_without_service_path(self):
+        fiware_manager = self.fake.connector()
+        fiware_manager.create("Room1", "Room")
+        fiware_manager.scoped(service_path="/a").create("Room2", "Room")
+        status = {"status": {"value": "closed", "type": "Text"}}
+        self.assertEqual(fiware_manager.update_where({"entity_type": "Room"}, status, action="append"), 1)
+        self.assertEqual(fiware_manager.count(query="status==closed"), 1)
+        self.assertEqual(fiware_manager.get("Room2", key_values=True), {"id": "Room2", "type": "Room"})
+        with self.assertRaises(FiException):
+            fiware_manager.scoped(service_path="/a").update_where(
+                {"entity_type": "Room", "hierarchical_search": True}, status, action="append")
+
+    def test_subscriptions(self):
+        subscription_id, _ = self.fiware_manager.subscribe(
+            "Temperature", [{"idPattern": ".*", "type": "Room"}], condition_attributes=["temperature"],
+            http="http://127.0.0.1:8080/notify")
+        self.assertEqual(self.fiware_manager.subscription(subscription_id)["description"], "Temperature")
+        self.fiware_manager.create("Room1", "Room", temperature=20)
+        self.fiware_manager.patch("Room1", "Room", temperature={"value": 21, "type": "Number"})
+        self.assertEqual([notification["data"][0]["temperature"]["value"]
+                          for notification in self.fake.notifications], [20, 21])
+        self.fiware_manager.subscription_update(subscription_id, status="inactive")
+        self.assertEqual(self.fiware_manager.subscriptions()["status"], "inactive")
+        self.fiware_manager.unsubscribe(subscription_id=subscription_id)
+        self.assertEqual(self.fiware_manager.subscriptions(), [])
+
+    def test_subscription_rendering(self):
+        subscription_id, _ = self.fiware_manager.subscribe(
+            "Expired", [{"idPattern": ".*", "type": "Room"}], condition_attributes=["temperature"],
+            http="http://127.0.0.1:8080/notify", expires="2016-04-05T14:00:00.00Z")
+        subscription = self.fiware_manager.subscription(subscription_id)
+        self.assertEqual((subscription["expires"], subscription["status"]), ("2016-04-05T14:00:00.000Z", "expired"))
+        self.assertEqual(subscription["notification"], {"attrs": [], "attrsFormat": "normalized",
+                                                        "http": {"url": "http://127.0.0.1:8080/notify"},
+                                                        "onlyChangedAttrs": False})
+        self.fiware_manager.create("Room1", "Room", temperature=20)
+        self.assertEqual(self.fake.notifications, [])
+        with self.assertRaises(FiException) as context:
+            self.fiware_manager.subscribe("No id", [{"type": "Room"}], http="http://127.0.0.1:8080/notify")
+        self.assertEqual(context.exception.status, 400)
+
+    def test_sync_with_dedup(self):
+        fiware_manager = self.fake.connector(service="tenant", service_path="/city", dedup=WriteDedup())
+        fiware_manager.create("Room1", "Room", t=5)
+        # Another writer changes the entity behind the dedup
+        self.fiware_manager.patch("Room1", "Room", t={"value": 7, "type": "Integer"})
+        stats = fiware_manager.sync_entity({"id": "Room1", "type": "Room", "t": {"value": 5, "type": "Integer"}})
+        self.assertEqual(stats["updated"], 1)
+        self.assertEqual(fiware_manager.dedup.skipped_requests, 0)
+        self.assertEqual(self.fiware_manager.get("Room1", key_values=True)["t"], 5)
+        # The written value is remembered
+        fiware_manager.patch("Room1", "Room", t={"value": 5, "type": "Integer"})
+        self.assertEqual(fiware_manager.dedup.skipped_requests, 1)
+
+    def test_http(self):
+        url = self.fake.serve()
+        try:
+            fiware_manager = OrionConnector(url, service="tenant", service_path="/city")
+            fiware_manager.create("Room1", "Room", temperature=20)
+            self.assertEqual(self.fiware_manager.get("Room1", key_values=True)["temperature"], 20)
+            self.assertEqual(fiware_manager.search(key_values=True),
+                             [{"id": "Room1", "type": "Room", "temperature": 20}])
+        finally:
+            self.fake.shutdown()
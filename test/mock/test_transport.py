@@ -0,0 +1,54 @@
+import json
+from unittest import TestCase
+from unittest.mock import Mock
+
+from pyfiware import OrionConnector
+from pyfiware.history import HistoryConnector
+from pyfiware.transport import MemoryTransport, Urllib3Transport
+
+ROOM = {"id": "Room1", "type": "Room", "temperature": {"value": 20, "type": "Number"}}
+
+
+def handler(request):
+    if request.path == "/v2/entities/Room1":
+        return 200, {"Content-Type": "application/json"}, json.dumps(ROOM)
+    if request.path == "/v2/entities":
+        return 200, {"Fiware-Total-Count": 1}, json.dumps([ROOM][int(request.query.get("offset", 0)):])
+    return 404, {}, ""
+
+
+class TestMemoryTransport(TestCase):
+
+    def test_orion(self):
+        transport = MemoryTransport(handler)
+        fiware_manager = OrionConnector("http://orion", transport=transport)
+        self.assertEqual(fiware_manager.get("Room1"), ROOM)
+        self.assertIsNone(fiware_manager.get("Room2"))
+        self.assertEqual(fiware_manager.count(entity_type="Room"), 1)
+        self.assertEqual(transport.requests, 3)
+        # The default transport is not replaced
+        self.assertIsInstance(OrionConnector("http://orion")._transport, Urllib3Transport)
+
+    def test_streamed_response(self):
+        fiware_manager = OrionConnector("http://orion", transport=MemoryTransport(handler), compression=True)
+        self.assertEqual(fiware_manager.get("Room1"), ROOM)
+        self.assertEqual(fiware_manager.bytes_saved, 0)
+
+    def test_history(self):
+        requests = []
+
+        def history_handler(request):
+            requests.append(request)
+            return 201, {}, ""
+
+        HistoryConnector("http://history", "TOKEN", transport=MemoryTransport(history_handler)).scenario_create("s1")
+        self.assertEqual((requests[0].method, requests[0].path), ("POST", "/api/scenario/s1"))
+
+
+class TestUrllib3Transport(TestCase):
+
+    def test_request(self):
+        pool_manager = Mock()
+        Urllib3Transport(pool_manager).request("GET", "http://orion/v2/entities", fields={"limit": 1})
+        self.assertEqual(pool_manager.request.call_args[1]["fields"], {"limit": 1})
+        self.assertEqual(Urllib3Transport(maxsize=8).maxsize, 8)